@@ -0,0 +1,112 @@
+import time
+from typing import Optional
+
+from loguru import logger
+from prometheus_client import Gauge, Counter
+
+ADAPTER_CONNECTIONS = Gauge(
+    name='adapter_connections', documentation='Devices assigned to a bluetooth adapter',
+    namespace='sensor_hub', subsystem='collector', labelnames=['adapter'],
+)
+ADAPTER_NOTIFICATIONS = Counter(
+    name='adapter_notifications', documentation='Notifications received through a bluetooth adapter',
+    namespace='sensor_hub', subsystem='collector', labelnames=['adapter'],
+)
+ADAPTER_HEALTHY = Gauge(
+    name='adapter_healthy', documentation='Whether new devices are assigned to a bluetooth adapter',
+    namespace='sensor_hub', subsystem='collector', labelnames=['adapter'],
+)
+
+
+class AdapterPool:
+    """
+    Spreads device connections across several hci adapters.
+
+    New devices go to the healthy adapter with the fewest connections ('connections'),
+    or to the one that heard the device best recently ('rssi'), falling back to connection count.
+    An adapter that keeps failing is benched for failure_cooldown seconds; its devices get reassigned
+    when they reconnect after the disconnect.
+    """
+
+    def __init__(
+            self,
+            adapters: list[str],
+            strategy: str = 'connections',
+            rssi_max_age: float = 30.0,
+            max_failures: int = 3,
+            failure_cooldown: float = 120.0,
+    ):
+        if strategy not in {'connections', 'rssi'}:
+            raise ValueError(f'Unknown adapter strategy {strategy}')
+
+        self.adapters = list(adapters)
+        self.strategy = strategy
+        self.rssi_max_age = rssi_max_age
+        self.max_failures = max_failures
+        self.failure_cooldown = failure_cooldown
+        self.assignments: dict[str, str] = {}
+        self.connections: dict[str, set[str]] = {adapter: set() for adapter in self.adapters}
+        self.failures: dict[str, int] = {adapter: 0 for adapter in self.adapters}
+        self.benched_until: dict[str, float] = {}
+        # address -> adapter -> (rssi, monotonic time)
+        self.rssi: dict[str, dict[str, tuple[int, float]]] = {}
+
+        for adapter in self.adapters:
+            ADAPTER_CONNECTIONS.labels(adapter=adapter).set(0)
+            ADAPTER_HEALTHY.labels(adapter=adapter).set(1)
+
+    def healthy_adapters(self) -> list[str]:
+        now = time.monotonic()
+        healthy = [adapter for adapter in self.adapters if self.benched_until.get(adapter, 0) <= now]
+        # with every adapter benched, still try the least bad one rather than nothing
+        return healthy or sorted(self.adapters, key=lambda adapter: self.benched_until.get(adapter, 0))[:1]
+
+    def observe(self, adapter: Optional[str], address: str, rssi: int):
+        if adapter is None:
+            return
+        self.rssi.setdefault(address, {})[adapter] = rssi, time.monotonic()
+
+    def _recent_rssi(self, address: str, adapter: str) -> float:
+        rssi, seen_at = self.rssi.get(address, {}).get(adapter, (None, 0.0))
+        if rssi is None or time.monotonic() - seen_at > self.rssi_max_age:
+            return float('-inf')
+        return rssi
+
+    def acquire(self, address: str) -> str:
+        self.release(address)
+
+        def key(adapter: str):
+            connections = len(self.connections[adapter])
+            if self.strategy == 'rssi':
+                return -self._recent_rssi(address, adapter), connections
+            return connections, -self._recent_rssi(address, adapter)
+
+        adapter = min(self.healthy_adapters(), key=key)
+        self.assignments[address] = adapter
+        self.connections[adapter].add(address)
+        ADAPTER_CONNECTIONS.labels(adapter=adapter).set(len(self.connections[adapter]))
+        logger.info(f'Assigned {address} to {adapter}')
+        return adapter
+
+    def release(self, address: str):
+        adapter = self.assignments.pop(address, None)
+        if adapter is None:
+            return
+
+        self.connections[adapter].discard(address)
+        ADAPTER_CONNECTIONS.labels(adapter=adapter).set(len(self.connections[adapter]))
+
+    def report_success(self, adapter: str):
+        self.failures[adapter] = 0
+
+    def report_failure(self, adapter: str):
+        self.failures[adapter] += 1
+        if self.failures[adapter] < self.max_failures:
+            return
+
+        logger.error(f'Adapter {adapter} failed {self.failures[adapter]} times; benched for {self.failure_cooldown}s')
+        self.failures[adapter] = 0
+        self.benched_until[adapter] = time.monotonic() + self.failure_cooldown
+        ADAPTER_HEALTHY.labels(adapter=adapter).set_function(
+            lambda: float(self.benched_until.get(adapter, 0) <= time.monotonic())
+        )
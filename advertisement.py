@@ -0,0 +1,114 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from loguru import logger
+from prometheus_client import REGISTRY
+
+from service.abstract_service import AbstractService
+from service_manager import ServiceManager
+
+# EXPERIMENTAL: no released Sensor Hub firmware advertises sensor values yet. This is the format proposed for it,
+# so the ingest is off unless DeviceManager(advertisement_ingest=True) and must follow the firmware once it ships.
+# Manufacturer data is a sequence of [field id: u8][length: u8][value] records, every value in the byte layout
+# of the GATT characteristic it mirrors, so the usual deserializers apply. 0xFFFF is the company id the
+# Bluetooth SIG reserves for testing, until the firmware settles on its own.
+MANUFACTURER_ID = 0xFFFF
+
+BME280_SERVICE_UUID = '5c853275-723b-4754-a329-969d4bc8121e'
+DEVICE_INFORMATION_SERVICE_UUID = '0000180a-0000-1000-8000-00805f9b34fb'
+
+ADVERTISED_FIELDS: dict[int, tuple[str, str]] = {
+    1: (BME280_SERVICE_UUID, '00002a6e-0000-1000-8000-00805f9b34fb'),  # temperature
+    2: (BME280_SERVICE_UUID, '00002a6d-0000-1000-8000-00805f9b34fb'),  # pressure
+    3: (BME280_SERVICE_UUID, '00002a6f-0000-1000-8000-00805f9b34fb'),  # humidity
+    4: (DEVICE_INFORMATION_SERVICE_UUID, '00002b18-0000-1000-8999-00805f9b34fb'),  # battery voltage
+}
+
+
+@dataclass(frozen=True)
+class AdvertisedCharacteristic:
+    uuid: str
+    # the field id doubles as the handle for the state dispatch table
+    handle: int
+
+
+def parse_records(payload: bytes):
+    offset = 0
+    while offset + 2 <= len(payload):
+        field_id, length = payload[offset], payload[offset + 1]
+        value = payload[offset + 2:offset + 2 + length]
+        if len(value) != length:
+            raise ValueError(f'Truncated advertisement record {field_id}: {payload.hex()}')
+        yield field_id, bytearray(value)
+        offset += 2 + length
+
+
+class AdvertisementIngest:
+    """
+    Updates service states straight from advertisement payloads, without connecting to the device.
+    The states are the same ones a connected ServiceManager builds and are fed through the same notification path,
+    so the exported metrics are identical. A device not heard for stale_after seconds has its series removed.
+    """
+
+    def __init__(self, labels_for: Callable[[str], dict[str, str]], stale_after: float = 300.0):
+        self.labels_for = labels_for
+        self.stale_after = stale_after
+        self._services: dict[tuple[str, str], AbstractService] = {}
+        self._last_payload: dict[str, bytes] = {}
+        self._last_seen: dict[str, float] = {}
+
+    def _get_or_create_service(self, address: str, service_uuid: str) -> AbstractService:
+        service = self._services.get((address, service_uuid))
+        if service is None:
+            service_class = ServiceManager.SERVICE_CLASS_MAP[service_uuid]
+            service = service_class(None, None, REGISTRY, labels=self.labels_for(address))
+            self._services[(address, service_uuid)] = service
+            logger.info(f'Ingesting advertisements of {address} into {service.display_name}')
+        return service
+
+    def ingest(self, device: BLEDevice, advertisement_data: AdvertisementData):
+        payload = advertisement_data.manufacturer_data.get(MANUFACTURER_ID)
+        if payload is None:
+            return
+        self._last_seen[device.address] = time.monotonic()
+        # BlueZ repeats the same advertisement until the device changes it
+        if self._last_payload.get(device.address) == payload:
+            return
+        self._last_payload[device.address] = payload
+
+        try:
+            records = list(parse_records(payload))
+        except ValueError as e:
+            logger.warning(f'{device.address}: {e}')
+            return
+
+        for field_id, value in records:
+            field = ADVERTISED_FIELDS.get(field_id)
+            if field is None:
+                continue
+
+            service_uuid, characteristic_uuid = field
+            service = self._get_or_create_service(device.address, service_uuid)
+            # through the ingest queue when there is one, like a notification
+            service.state.handle_notification(AdvertisedCharacteristic(characteristic_uuid, field_id), value)
+
+    def expire(self, now: float) -> int:
+        """Remove the series of devices not heard for stale_after seconds; returns how many devices expired"""
+        stale = [address for address, seen_at in self._last_seen.items() if now - seen_at > self.stale_after]
+        for address in stale:
+            del self._last_seen[address]
+            self._last_payload.pop(address, None)
+            for key in [key for key in self._services if key[0] == address]:
+                service = self._services.pop(key)
+                service.reset_state_metrics()
+                logger.info(f'Stopped ingesting advertisements of {address} into {service.display_name}')
+        return len(stale)
+
+    async def run(self, interval: float = 30.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire(time.monotonic())
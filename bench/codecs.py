@@ -0,0 +1,78 @@
+"""
+Cost of decoding one notification with the compiled codecs versus the former free functions,
+for every format used by AdcService, Bme280Service, LIS2DH12Service and VEML6040Service.
+
+    python -m bench.codecs
+"""
+import random
+import struct
+import timeit
+
+from conv import compute_r, get_codec
+
+NUMBER = 200_000
+
+
+def legacy_voltage(data: bytearray):
+    value = int.from_bytes(data, byteorder='little', signed=False)
+    return compute_r(value, 1, 0, -6)
+
+
+def legacy_int(data: bytearray):
+    return int.from_bytes(data, byteorder='little', signed=False)
+
+
+def legacy_float(data: bytearray):
+    import struct
+    value = struct.unpack('f', data)
+    return value[0]
+
+
+def legacy_temperature(data: bytearray):
+    value = int.from_bytes(data, byteorder='little', signed=True)
+    return compute_r(value, 1, -2, 0)
+
+
+def legacy_pressure(data: bytearray):
+    value = int.from_bytes(data, byteorder='little', signed=True)
+    return compute_r(value, 1, -1, 0)
+
+
+def legacy_humidity(data: bytearray):
+    value = int.from_bytes(data, byteorder='little', signed=True)
+    return compute_r(value, 1, -2, 0)
+
+
+# codec name, legacy function, sample payload
+FORMATS = [
+    ('voltage', legacy_voltage, bytearray(struct.pack('<H', 212))),
+    ('int', legacy_int, bytearray(struct.pack('<I', 1500))),
+    ('int', legacy_int, bytearray(struct.pack('<H', 4321))),
+    ('float', legacy_float, bytearray(struct.pack('<f', -0.981))),
+    ('temperature', legacy_temperature, bytearray(struct.pack('<h', 2345))),
+    ('pressure', legacy_pressure, bytearray(struct.pack('<i', 1013250))),
+    ('humidity', legacy_humidity, bytearray(struct.pack('<h', 4567))),
+]
+
+
+def check():
+    for name, legacy, _ in FORMATS:
+        codec = get_codec(name)
+        for _ in range(1000):
+            data = bytearray(random.randbytes(codec.width))
+            expected, actual = legacy(data), codec(data)
+            assert expected == actual or (expected != expected and actual != actual), (name, data, expected, actual)
+
+
+def main():
+    check()
+    print(f'{"format":>12} {"bytes":>5} {"legacy":>10} {"codec":>10}')
+    for name, legacy, data in FORMATS:
+        codec = get_codec(name)
+        legacy_time = min(timeit.repeat(lambda: legacy(data), number=NUMBER, repeat=5)) / NUMBER
+        codec_time = min(timeit.repeat(lambda: codec(data), number=NUMBER, repeat=5)) / NUMBER
+        print(f'{name:>12} {len(data):5d} {legacy_time * 1e9:8.0f}ns {codec_time * 1e9:8.0f}ns')
+
+
+if __name__ == '__main__':
+    main()
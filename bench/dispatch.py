@@ -0,0 +1,46 @@
+"""
+Per-notification cost of ServiceState.update_characteristic as the number of characteristics grows.
+
+    python -m bench.dispatch
+"""
+import timeit
+from dataclasses import make_dataclass
+
+from loguru import logger
+from prometheus_client import Gauge
+
+from bench.fakes import FakeCharacteristic
+from characteristic.notifiable_characteristic import NotifiableCharacteristic
+from conv import get_codec
+from service.state import ServiceState
+
+
+def make_state(size: int) -> ServiceState:
+    fields = [(f'ch_{i}', NotifiableCharacteristic) for i in range(size)]
+    state_class = make_dataclass(f'BenchState{size}', fields, bases=(ServiceState,))
+    gauge = Gauge(name=f'bench_dispatch_{size}', documentation='bench', labelnames=['device'], registry=None)
+    return state_class(**{
+        f'ch_{i}': NotifiableCharacteristic(
+            uuid=f'{i:08x}-0000-1000-8000-00805f9b34fb',
+            deserialize_fn=get_codec('int'),
+            metric=gauge,
+            label_dict={'device': 'bench'},
+        )
+        for i in range(size)
+    })
+
+
+def main():
+    logger.remove()
+    data = bytearray(b'\x01\x00\x00\x00')
+    number = 20_000
+    for size in (4, 16, 64, 256):
+        state = make_state(size)
+        # the last declared characteristic is the worst case for a linear scan
+        characteristic = FakeCharacteristic(uuid=f'{size - 1:08X}-0000-1000-8000-00805F9B34FB', handle=size)
+        elapsed = timeit.timeit(lambda: state.update_characteristic(characteristic, data), number=number)
+        print(f'{size:4d} characteristics: {elapsed / number * 1e6:8.2f} us/notification')
+
+
+if __name__ == '__main__':
+    main()
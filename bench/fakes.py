@@ -0,0 +1,53 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class FakeCharacteristic:
+    uuid: str
+    handle: int
+    description: str = ''
+    max_write_without_response_size: int = 244
+
+
+@dataclass
+class FakeService:
+    uuid: str
+    characteristics: list[FakeCharacteristic] = field(default_factory=list)
+
+    def get_characteristic(self, uuid: str) -> Optional[FakeCharacteristic]:
+        for characteristic in self.characteristics:
+            if characteristic.uuid.lower() == uuid.lower():
+                return characteristic
+        return None
+
+
+class FakeClient:
+    """Stands in for BleakClient: records notification callbacks and fires them on demand"""
+
+    def __init__(self, services: Optional[list[FakeService]] = None, address: str = '00:00:00:00:00:00'):
+        self.services = services or []
+        self.address = address
+        self.callbacks: dict[int, tuple[FakeCharacteristic, Callable]] = {}
+        self.is_connected = True
+        self.mtu_size = 247
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def start_notify(self, characteristic: FakeCharacteristic, callback: Callable):
+        self.callbacks[characteristic.handle] = characteristic, callback
+
+    def notify(self, handle: int, data: bytearray):
+        characteristic, callback = self.callbacks[handle]
+        callback(characteristic, data)
+
+
+def fake_service(uuid: str, characteristic_uuids: list[str], first_handle: int = 1) -> FakeService:
+    return FakeService(uuid=uuid, characteristics=[
+        FakeCharacteristic(uuid=characteristic_uuid, handle=handle)
+        for handle, characteristic_uuid in enumerate(characteristic_uuids, start=first_handle)
+    ])
@@ -0,0 +1,83 @@
+"""
+Time spent inside the notification callback with metric updates applied inline versus through the ingest queue,
+for Bme280Service with eagerly computed psychrometrics as the slow derived metric.
+
+    python -m bench.ingest
+"""
+import asyncio
+import random
+import statistics
+import time
+
+from loguru import logger
+from prometheus_client import CollectorRegistry
+
+from bench.fakes import FakeClient, fake_service
+from conv import get_codec
+from ingest import IngestQueue
+from service.bme_280 import Bme280Service
+from service.state import ServiceState
+
+BME280_SERVICE_UUID = '5c853275-723b-4754-a329-969d4bc8121e'
+LABELS = {'room': 'bench', 'location': 'bench', 'env': 'bench', 'device': 'AA:BB:CC:DD:EE:FF'}
+NOTIFICATIONS = 5_000
+
+
+async def make_client() -> FakeClient:
+    client = FakeClient([fake_service(BME280_SERVICE_UUID, [])])
+    service = Bme280Service(client, client.services[0], CollectorRegistry(), labels=LABELS)
+    client.services[0].characteristics = fake_service(
+        BME280_SERVICE_UUID, [nch.uuid for nch in service.state._characteristics]
+    ).characteristics
+    await service.subscribe()
+    return client
+
+
+def payloads(client: FakeClient):
+    codecs = {
+        '00002a6e-0000-1000-8000-00805f9b34fb': ('temperature', lambda: random.uniform(15, 30)),
+        '00002a6d-0000-1000-8000-00805f9b34fb': ('pressure', lambda: random.uniform(98000, 103000)),
+        '00002a6f-0000-1000-8000-00805f9b34fb': ('humidity', lambda: random.uniform(20, 80)),
+    }
+    handles = [
+        (handle, codecs[characteristic.uuid]) for handle, (characteristic, _) in client.callbacks.items()
+        if characteristic.uuid in codecs
+    ]
+    for i in range(NOTIFICATIONS):
+        handle, (codec, value) = handles[i % len(handles)]
+        yield handle, bytearray(get_codec(codec).encode(value()))
+
+
+async def run(client: FakeClient, queue: IngestQueue | None) -> list[float]:
+    ServiceState.ingest_queue = queue
+    if queue is not None:
+        queue.start()
+
+    callback_times = []
+    for handle, data in payloads(client):
+        started_at = time.perf_counter()
+        client.notify(handle, data)
+        callback_times.append(time.perf_counter() - started_at)
+        # notifications arrive one D-Bus message at a time
+        await asyncio.sleep(0)
+
+    if queue is not None:
+        while queue.queue:
+            await asyncio.sleep(0)
+        queue.stop()
+    ServiceState.ingest_queue = None
+    return sorted(callback_times)
+
+
+async def main():
+    logger.remove()
+    client = await make_client()
+
+    for name, queue in (('inline', None), ('ingest queue', IngestQueue(maxsize=1024, batch_size=64))):
+        times = await run(client, queue)
+        p99 = times[int(len(times) * 0.99)]
+        print(f'{name:>12}: callback mean {statistics.mean(times) * 1e6:7.1f}us, p99 {p99 * 1e6:7.1f}us')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
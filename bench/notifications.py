@@ -0,0 +1,64 @@
+"""
+Notifications per second through AdcService with per-update labels(**label_dict) versus pre-bound children.
+
+    python -m bench.notifications
+"""
+import asyncio
+import time
+
+from loguru import logger
+from prometheus_client import CollectorRegistry
+
+from bench.fakes import FakeClient, fake_service
+from characteristic.notifiable_characteristic import MetricResetMixin
+from service.adc import AdcService
+
+ADC_SERVICE_UUID = '5c853275-723b-4754-a329-969d8bc8121d'
+LABELS = {'room': 'bench', 'location': 'bench', 'env': 'bench', 'device': 'AA:BB:CC:DD:EE:FF'}
+
+
+def set_metric_unbound(self, value):
+    self.metric.labels(**self.label_dict).set(value)
+
+
+async def make_client() -> FakeClient:
+    client = FakeClient([fake_service(ADC_SERVICE_UUID, [])])
+    service = AdcService(client, client.services[0], CollectorRegistry(), labels=LABELS)
+    # expose a GATT characteristic for every characteristic the state knows about
+    client.services[0].characteristics = fake_service(
+        ADC_SERVICE_UUID, [nch.uuid for nch in service.state._characteristics]
+    ).characteristics
+    await service.subscribe()
+    return client
+
+
+def fire(client: FakeClient, rounds: int) -> float:
+    data = bytearray((1_500_000).to_bytes(4, 'little'))
+    handles = list(client.callbacks)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for handle in handles:
+            client.notify(handle, data)
+    return rounds * len(handles) / (time.perf_counter() - start)
+
+
+async def main():
+    logger.remove()
+    rounds = 5_000
+    client = await make_client()
+
+    bound = fire(client, rounds)
+
+    set_metric_bound = MetricResetMixin.set_metric
+    MetricResetMixin.set_metric = set_metric_unbound
+    try:
+        unbound = fire(client, rounds)
+    finally:
+        MetricResetMixin.set_metric = set_metric_bound
+
+    print(f'labels(**label_dict) per update: {unbound:10.0f} notifications/s')
+    print(f'pre-bound child:                 {bound:10.0f} notifications/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
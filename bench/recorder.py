@@ -0,0 +1,52 @@
+"""
+Cost the notification recorder adds to every notification, and a read-back of what it wrote.
+
+    python -m bench.recorder
+"""
+import random
+import tempfile
+import time
+
+from loguru import logger
+
+from bench.fakes import FakeCharacteristic
+from recorder import NotificationRecorder, read_log
+
+NOTIFICATIONS = 200_000
+DEVICES = 32
+
+
+def fire(callbacks, characteristics, payloads) -> float:
+    start = time.perf_counter()
+    for i in range(NOTIFICATIONS):
+        callbacks[i % DEVICES](characteristics[i % len(characteristics)], payloads[i % len(payloads)])
+    return (time.perf_counter() - start) / NOTIFICATIONS
+
+
+def main():
+    logger.remove()
+    characteristics = [FakeCharacteristic(uuid=f'{i:08x}-0000-1000-8000-00805f9b34fb', handle=i) for i in range(8)]
+    payloads = [bytearray(random.randbytes(size)) for size in (2, 4, 4, 16)]
+    addresses = [f'AA:BB:CC:DD:{i >> 8:02X}:{i & 0xFF:02X}' for i in range(DEVICES)]
+
+    def noop(characteristic, data):
+        pass
+
+    baseline = fire([noop] * DEVICES, characteristics, payloads)
+    with tempfile.TemporaryDirectory() as directory:
+        # small segments so the run includes rotations
+        recorder = NotificationRecorder(directory, segment_size=1024 * 1024)
+        recorded = fire(
+            [recorder.wrap(address, noop) for address in addresses], characteristics, payloads
+        )
+        segments = len(NotificationRecorder.segments(directory))
+        recorder.close()
+        count = sum(1 for _ in read_log(directory))
+
+    print(f'callback alone:  {baseline * 1e6:6.2f}us/notification')
+    print(f'with recorder:   {recorded * 1e6:6.2f}us/notification (+{(recorded - baseline) * 1e6:.2f}us)')
+    print(f'read back {count} of {NOTIFICATIONS} notifications from {segments} segments')
+
+
+if __name__ == '__main__':
+    main()
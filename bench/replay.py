@@ -0,0 +1,224 @@
+"""
+Replays notification streams through the real ServiceManager / AbstractService / ServiceState pipeline.
+Hubs get a fake client exposing the GATT profile of every service in SERVICE_CLASS_MAP but the expander,
+so no radio is needed. Streams are either recorded (see recorder.py) or synthetic.
+
+Benchmark over 10, 100 and 1000 synthetic hubs:
+
+    python -m bench.replay
+
+Replay a recording, as fast as possible or at the recorded pace:
+
+    python -m bench.replay --log recordings [--pace]
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Iterable, Optional
+
+from loguru import logger
+from prometheus_client import CollectorRegistry
+
+from bench.fakes import FakeClient, FakeService, fake_service
+from recorder import RecordedNotification, read_log
+from service.expander import ExpanderService
+from service_manager import ServiceManager
+
+DEFAULT_LABELS = {'room': 'replay', 'location': 'replay', 'env': 'replay'}
+# plausible value ranges per codec, so derived metrics see realistic inputs
+VALUE_RANGES = {
+    'voltage': (0.0, 3.3),
+    'temperature': (15.0, 30.0),
+    'pressure': (98000.0, 103000.0),
+    'humidity': (20.0, 80.0),
+    'float': (-2.0, 2.0),
+    'int': (0, 1000),
+}
+
+
+@cache
+def service_profile() -> tuple[tuple[str, tuple[tuple[str, object], ...]], ...]:
+    """(service uuid, ((characteristic uuid, codec), ...)) of every service a replayed hub exposes"""
+    profile = []
+    for service_uuid, service_class in ServiceManager.SERVICE_CLASS_MAP.items():
+        if issubclass(service_class, ExpanderService):
+            continue
+        service = service_class(None, None, CollectorRegistry(), labels={})
+        profile.append((service_uuid, tuple((nch.uuid, nch.deserialize_fn) for nch in service.state._characteristics)))
+    return tuple(profile)
+
+
+class ReplayClient(FakeClient):
+    def __init__(self, address: str, **kwargs):
+        services: list[FakeService] = []
+        handle = 1
+        for service_uuid, characteristics in service_profile():
+            services.append(fake_service(service_uuid, [uuid for uuid, _ in characteristics], first_handle=handle))
+            handle += len(characteristics)
+        super().__init__(services, address=address)
+
+        # a UUID shared by several services goes to the first one, as recordings only keep the UUID
+        self.handles: dict[str, int] = {}
+        for service in services:
+            for characteristic in service.characteristics:
+                self.handles.setdefault(characteristic.uuid, characteristic.handle)
+
+
+class ReplayServiceManager(ServiceManager):
+    client_factory = ReplayClient
+
+
+@dataclass
+class ReplayStats:
+    notifications: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        return self.notifications / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+
+class ReplayEngine:
+    def __init__(self):
+        self.managers: dict[str, ReplayServiceManager] = {}
+
+    async def add_hub(self, address: str) -> ReplayServiceManager:
+        manager = ReplayServiceManager(address, labels={**DEFAULT_LABELS, 'device': address})
+        await manager.subscribe_all()
+        self.managers[address] = manager
+        return manager
+
+    async def run(
+            self, notifications: Iterable[RecordedNotification], pace: bool = False, yield_every: int = 64
+    ) -> ReplayStats:
+        """
+        Hand every notification to the callback bleak would call, creating hubs as their addresses show up.
+        With pace, notifications are spaced like their timestamps; otherwise the loop only gets a turn
+        every yield_every notifications, e.g. for ingest queue consumers and coalesced flushes.
+        """
+        stats = ReplayStats()
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        first_timestamp_ns: Optional[int] = None
+        setup_time = 0.0
+
+        for timestamp_ns, address, uuid, data in notifications:
+            manager = self.managers.get(address)
+            if manager is None:
+                setup_started_at = loop.time()
+                manager = await self.add_hub(address)
+                setup_time += loop.time() - setup_started_at
+
+            client: ReplayClient = manager.client
+            handle = client.handles.get(uuid)
+            if handle is None or handle not in client.callbacks:
+                stats.skipped += 1
+                continue
+
+            if pace:
+                if first_timestamp_ns is None:
+                    first_timestamp_ns = timestamp_ns
+                delay = started_at + setup_time + (timestamp_ns - first_timestamp_ns) / 1e9 - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif stats.notifications % yield_every == 0:
+                await asyncio.sleep(0)
+
+            callback_started_at = time.perf_counter()
+            client.notify(handle, bytearray(data))
+            stats.latencies.append(time.perf_counter() - callback_started_at)
+            stats.notifications += 1
+
+        stats.elapsed = loop.time() - started_at - setup_time
+        return stats
+
+
+def synthetic_stream(
+        addresses: list[str], rounds: int, interval: float = 1.0, seed: int = 0
+) -> list[RecordedNotification]:
+    """Every hub notifies every characteristic once per interval, at a random phase within it"""
+    rng = random.Random(seed)
+    characteristics = [characteristic for _, service in service_profile() for characteristic in service]
+
+    def payload(codec) -> bytes:
+        low, high = VALUE_RANGES.get(getattr(codec, 'name', None), (0, 100))
+        return codec.encode(rng.uniform(low, high))
+
+    payloads = {
+        uuid: [payload(codec) for _ in range(8)] for uuid, codec in characteristics if hasattr(codec, 'encode')
+    }
+    phases = {
+        (address, uuid): rng.random() * interval for address in addresses for uuid in payloads
+    }
+
+    notifications = []
+    for round_index in range(rounds):
+        batch = [
+            RecordedNotification(
+                int((round_index * interval + phase) * 1e9), address, uuid, rng.choice(payloads[uuid])
+            )
+            for (address, uuid), phase in phases.items()
+        ]
+        batch.sort(key=lambda notification: notification.timestamp_ns)
+        notifications.extend(batch)
+    return notifications
+
+
+async def benchmark(hubs: int, rounds: int = 5) -> tuple[ReplayStats, float]:
+    addresses = [f'5A:{hubs >> 8:02X}:{hubs & 0xFF:02X}:00:{i >> 8:02X}:{i & 0xFF:02X}' for i in range(hubs)]
+    notifications = synthetic_stream(addresses, rounds)
+    engine = ReplayEngine()
+
+    gc.collect()
+    tracemalloc.start()
+    for address in addresses:
+        await engine.add_hub(address)
+    # one round so every metric child and cache exists before measuring
+    await engine.run(notifications[:len(notifications) // rounds])
+    memory_per_hub = tracemalloc.get_traced_memory()[0] / hubs
+    tracemalloc.stop()
+
+    stats = await engine.run(notifications[len(notifications) // rounds:])
+    return stats, memory_per_hub
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='directory of a notification recording to replay')
+    parser.add_argument('--pace', action='store_true', help='replay at the recorded pace')
+    args = parser.parse_args()
+    logger.remove()
+
+    if args.log is not None:
+        stats = await ReplayEngine().run(read_log(args.log), pace=args.pace)
+        print(
+            f'{stats.notifications} notifications ({stats.skipped} skipped) in {stats.elapsed:.2f}s: '
+            f'{stats.rate:.0f}/s, callback p50 {stats.percentile(0.5) * 1e6:.1f}us '
+            f'p99 {stats.percentile(0.99) * 1e6:.1f}us'
+        )
+        return
+
+    print(f'{"hubs":>5} {"notifications/s":>16} {"p50":>9} {"p99":>9} {"memory/hub":>11}')
+    for hubs in (10, 100, 1000):
+        stats, memory_per_hub = await benchmark(hubs)
+        print(
+            f'{hubs:5d} {stats.rate:16.0f} {stats.percentile(0.5) * 1e6:7.1f}us {stats.percentile(0.99) * 1e6:7.1f}us '
+            f'{memory_per_hub / 1024:8.1f}KiB'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
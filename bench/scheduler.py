@@ -0,0 +1,89 @@
+"""
+Staleness of time-shared devices as the fleet grows past the number of connection slots.
+
+Connect, GATT discovery and the first notification are simulated with sleeps, scaled down
+by TIME_SCALE so a run takes seconds; the reported numbers are scaled back up.
+
+    python -m bench.scheduler
+"""
+import asyncio
+import random
+import statistics
+import time
+
+from loguru import logger
+
+from scheduler import ConnectionScheduler, DevicePolicy
+
+TIME_SCALE = 0.01
+SLOTS = 4
+CONNECT_TIME = 3.0
+FIRST_SAMPLE_TIME = 2.0
+STALENESS_TARGET = 60.0
+DURATION = 600.0
+
+
+class FakeServiceManager:
+    def __init__(self, address: str):
+        self.address = address
+        self.first_sample_at = None
+        self.round_complete = asyncio.Event()
+
+    async def subscribe_all(self):
+        await asyncio.sleep(CONNECT_TIME * TIME_SCALE * random.uniform(0.5, 1.5))
+        asyncio.get_running_loop().call_later(
+            FIRST_SAMPLE_TIME * TIME_SCALE * random.uniform(0, 2), self._sample
+        )
+
+    def _sample(self):
+        self.first_sample_at = time.monotonic()
+        self.round_complete.set()
+
+    async def wait_round(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.round_complete.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def disconnect(self):
+        pass
+
+
+async def run(fleet_size: int) -> list[float]:
+    scheduler = ConnectionScheduler(
+        slots=SLOTS,
+        round_timeout=15.0 * TIME_SCALE,
+        default_policy=DevicePolicy(staleness_target=STALENESS_TARGET * TIME_SCALE),
+    )
+    for i in range(fleet_size):
+        scheduler.add(f'bench-{fleet_size}-{i}')
+
+    scheduler.start(FakeServiceManager)
+    samples = []
+    started_at = time.monotonic()
+    # skip the initial fill of the fleet, then sample the staleness of every device periodically
+    await asyncio.sleep(DURATION * TIME_SCALE / 4)
+    while time.monotonic() - started_at < DURATION * TIME_SCALE:
+        now = time.monotonic()
+        samples.extend(device.staleness(now) / TIME_SCALE for device in scheduler.devices.values())
+        await asyncio.sleep(TIME_SCALE)
+
+    scheduler.stop()
+    return samples
+
+
+async def main():
+    logger.remove()
+    print(
+        f'{SLOTS} slots, staleness target {STALENESS_TARGET:.0f}s, '
+        f'~{CONNECT_TIME + FIRST_SAMPLE_TIME:.0f}s per round'
+    )
+    for fleet_size in (4, 16, 32, 64, 128):
+        samples = sorted(await run(fleet_size))
+        p99 = samples[int(len(samples) * 0.99)]
+        print(f'{fleet_size:4d} devices: mean staleness {statistics.mean(samples):7.1f}s, p99 {p99:7.1f}s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
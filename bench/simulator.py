@@ -0,0 +1,406 @@
+"""
+In-process simulator of Sensor Hub devices: the sensor services of SERVICE_CLASS_MAP notify periodically,
+and the expander service speaks the data bundle / result / MISO protocol to a simulated I2C bus with an SCD41.
+
+Hubs are plugged into the real ServiceManager through client_factory, so onboarding, ExpanderService,
+SCD4X and ScdService run unchanged. The benchmark compares the expander cost of an SCD41 measurement
+with and without the optional firmware features:
+
+    python -m bench.simulator
+"""
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loguru import logger
+
+from bench.fakes import FakeClient, FakeCharacteristic, fake_service
+from bench.replay import VALUE_RANGES, service_profile
+from contrib import scd
+from service import expander
+from service.expander import ExpanderService
+from service.scd_service import ScdService
+from service_manager import ServiceManager
+
+EXPANDER_SERVICE_UUID = next(
+    uuid for uuid, service_class in ServiceManager.SERVICE_CLASS_MAP.items() if service_class is ExpanderService
+)
+EXPANDER_CHARACTERISTICS = [
+    expander.DATA_BUNDLE_UUID, expander.MISO_UUID, expander.CS_UUID, expander.LOCK_UUID, expander.POWER_UUID,
+    expander.RESULT_UUID,
+]
+LOCK_ERROR = -4
+COMMAND_ERROR = -3
+SIZE_ERROR = -7
+ADDRESS_ERROR = -8
+
+
+@dataclass
+class SimulationConfig:
+    # seconds between notifications of every sensor characteristic, varied by +-jitter of itself
+    notification_interval: float = 1.0
+    jitter: float = 0.2
+    # cost of a write without response or a notification; a read takes two
+    connection_interval: float = 0.0075
+    connect_time: float = 0.5
+    # firmware features, see the flags of ExpanderService
+    result_carries_miso: bool = False
+    inline_transfer_delay: bool = False
+    lease_locks: bool = False
+    i2c_byte_time: float = 0.0001
+    spi_byte_time: float = 0.000001
+    # SCD41 sampling period relative to the real sensor, which samples every 5 s (30 s in low power mode)
+    time_scale: float = 1.0
+
+
+class Scd41Model:
+    """SCD41 answering the commands SCD4X sends; a new sample is ready every sampling period"""
+
+    address = scd.DEFAULT_I2C_ADDRESS
+
+    def __init__(self, time_scale: float = 1.0, serial: int = 0x1234_5678_9ABC):
+        self.time_scale = time_scale
+        self.serial = serial
+        self.crc8 = scd.SCD4X(None).crc8
+        self.periodic_since: Optional[float] = None
+        self.low_power = False
+        self.last_read_sample = 0
+        self.temperature_offset = 0
+        self.altitude = 0
+        self.asc_enabled = 1
+        self.response = b''
+        self.commands: Counter[int] = Counter()
+
+    def _sample(self) -> int:
+        if self.periodic_since is None:
+            return 0
+        period = (30.0 if self.low_power else 5.0) * self.time_scale
+        return int((time.monotonic() - self.periodic_since) / period)
+
+    def _words(self, *words: int) -> bytes:
+        return b''.join(word.to_bytes(2, 'big') + bytes([self.crc8(word)]) for word in words)
+
+    def write(self, data: bytes):
+        command = int.from_bytes(data[:2], 'big')
+        self.commands[command] += 1
+        value = int.from_bytes(data[2:4], 'big') if len(data) >= 5 else None
+        self.response = b''
+
+        match command:
+            case scd.START_PERIODIC_MEASUREMENT | scd.START_LOW_POWER_PERIODIC_MEASUREMENT:
+                self.low_power = command == scd.START_LOW_POWER_PERIODIC_MEASUREMENT
+                self.periodic_since = time.monotonic()
+                self.last_read_sample = 0
+            case scd.STOP_PERIODIC_MEASUREMENT:
+                self.periodic_since = None
+            case scd.DATA_READY:
+                self.response = self._words(0x8006 if self._sample() > self.last_read_sample else 0x8000)
+            case scd.READ_MEASUREMENT:
+                self.last_read_sample = self._sample()
+                co2 = random.randint(400, 1200)
+                temperature = int((random.uniform(18, 26) + 45) * (1 << 16) / 175)
+                humidity = int(random.uniform(30, 60) * (1 << 16) / 100)
+                self.response = self._words(co2, temperature, humidity)
+            case scd.SERIAL_NUMBER:
+                self.response = self._words(self.serial >> 32, (self.serial >> 16) & 0xFFFF, self.serial & 0xFFFF)
+            case scd.GET_TEMP_OFFSET:
+                self.response = self._words(self.temperature_offset)
+            case scd.SET_TEMP_OFFSET:
+                self.temperature_offset = value
+            case scd.GET_ALTITUDE:
+                self.response = self._words(self.altitude)
+            case scd.SET_ALTITUDE:
+                self.altitude = value
+            case scd.GET_ASCE:
+                self.response = self._words(self.asc_enabled)
+            case scd.SET_ASCE:
+                self.asc_enabled = value
+
+    def read(self, size: int) -> bytes:
+        response, self.response = self.response[:size], self.response[size:]
+        # the sensor NACKs a read without a pending response; the expander reads 0xFF
+        return response + b'\xff' * (size - len(response))
+
+
+@dataclass
+class ExpanderStats:
+    bundles: int = 0
+    lock_writes: int = 0
+    lock_conflicts: int = 0
+    lock_held: float = 0.0
+    round_trips: list[float] = field(default_factory=list)
+
+
+class ExpanderModel:
+    """Expander firmware: executes data bundles one at a time against the simulated buses"""
+
+    def __init__(self, config: SimulationConfig, i2c_devices: dict[int, Scd41Model]):
+        self.config = config
+        self.i2c_devices = i2c_devices
+        self.lock_type = 0
+        self.locked_at = 0.0
+        self.lock_expires_at: Optional[float] = None
+        self.miso = b''
+        self.busy = asyncio.Lock()
+        self.stats = ExpanderStats()
+
+    def _expire_lease(self):
+        if self.lock_type and self.lock_expires_at is not None and time.monotonic() >= self.lock_expires_at:
+            self.release()
+
+    def acquire(self, lock_type: int, lease_ms: int = 0) -> bool:
+        self._expire_lease()
+        if self.lock_type and self.lock_type != lock_type:
+            self.stats.lock_conflicts += 1
+            return False
+
+        if not self.lock_type:
+            self.locked_at = time.monotonic()
+        self.lock_type = lock_type
+        self.lock_expires_at = time.monotonic() + lease_ms / 1000 if self.config.lease_locks and lease_ms else None
+        return True
+
+    def release(self):
+        if self.lock_type:
+            self.stats.lock_held += time.monotonic() - self.locked_at
+        self.lock_type = 0
+        self.lock_expires_at = None
+
+    def set_lock(self, data: bytes) -> int:
+        self.stats.lock_writes += 1
+        lock_type = data[0]
+        if lock_type == 0:
+            self.release()
+            return expander.ID_MAP[expander.LOCK_UUID]
+
+        lease_ms = int.from_bytes(data[1:3], 'little') if self.config.lease_locks else 0
+        return expander.ID_MAP[expander.LOCK_UUID] if self.acquire(lock_type, lease_ms) else LOCK_ERROR
+
+    async def run_bundle(self, data: bytes) -> int:
+        async with self.busy:
+            self.stats.bundles += 1
+            control = data[0]
+            if control & 0x80:
+                lease_ms = int.from_bytes(data[14:16], 'little') if self.config.lease_locks else 0
+                if not self.acquire(data[2], lease_ms):
+                    return LOCK_ERROR
+            else:
+                self._expire_lease()
+
+            command = data[7] if control & 0x10 else None
+            address = data[8] if control & 0x08 else None
+            size_read = int.from_bytes(data[9:11], 'little')
+            size_write = int.from_bytes(data[11:13], 'little')
+            transfer_delay = data[13] if self.config.inline_transfer_delay else 0
+            mosi = data[expander.BUNDLE_HEADER_SIZE:]
+            if len(mosi) != size_write:
+                return SIZE_ERROR
+
+            if command == 2 and address is None:
+                # SPI with MISO looped back to MOSI
+                await asyncio.sleep(size_write * self.config.spi_byte_time)
+                self.miso = bytes(mosi)
+                return expander.ID_MAP[expander.DATA_BUNDLE_UUID]
+
+            if command == 3:
+                self.miso = bytes(sorted(self.i2c_devices))
+                return expander.ID_MAP[expander.DATA_BUNDLE_UUID]
+
+            if command not in (0, 1, 2):
+                return COMMAND_ERROR
+
+            device = self.i2c_devices.get(address)
+            if device is None:
+                return ADDRESS_ERROR
+
+            self.miso = b''
+            if command in (0, 2):
+                await asyncio.sleep(size_write * self.config.i2c_byte_time)
+                device.write(mosi)
+            if command == 2 and transfer_delay:
+                await asyncio.sleep(transfer_delay / 1000)
+            if command in (1, 2):
+                await asyncio.sleep(size_read * self.config.i2c_byte_time)
+                self.miso = device.read(size_read)
+            return expander.ID_MAP[expander.DATA_BUNDLE_UUID]
+
+
+class SimulatedHubClient(FakeClient):
+    """BleakClient of one simulated hub; configured through the config class attribute"""
+
+    config = SimulationConfig()
+
+    def __init__(self, address: str, **kwargs):
+        services = []
+        handle = 1
+        self.codecs = {}
+        for service_uuid, characteristics in service_profile():
+            services.append(fake_service(service_uuid, [uuid for uuid, _ in characteristics], first_handle=handle))
+            handle += len(characteristics)
+            self.codecs.update((uuid, codec) for uuid, codec in characteristics if hasattr(codec, 'encode'))
+        services.append(fake_service(EXPANDER_SERVICE_UUID, EXPANDER_CHARACTERISTICS, first_handle=handle))
+        super().__init__(services, address=address)
+        self.is_connected = False
+
+        self.scd41 = Scd41Model(self.config.time_scale)
+        self.expander = ExpanderModel(self.config, {self.scd41.address: self.scd41})
+        self.result = services[-1].get_characteristic(expander.RESULT_UUID)
+        self.tasks: set[asyncio.Task] = set()
+
+    async def connect(self):
+        await asyncio.sleep(self.config.connect_time)
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def start_notify(self, characteristic: FakeCharacteristic, callback):
+        await asyncio.sleep(2 * self.config.connection_interval)
+        await super().start_notify(characteristic, callback)
+        if characteristic.uuid in self.codecs:
+            self._spawn(self._notify_periodically(characteristic))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _notify_periodically(self, characteristic: FakeCharacteristic):
+        codec = self.codecs[characteristic.uuid]
+        low, high = VALUE_RANGES.get(codec.name, (0, 100))
+        interval, jitter = self.config.notification_interval, self.config.jitter
+        while self.is_connected:
+            await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+            self.notify(characteristic.handle, bytearray(codec.encode(random.uniform(low, high))))
+
+    async def _respond(self, result, started_at: float, carries_miso: bool):
+        if asyncio.iscoroutine(result):
+            result = await result
+        payload = (result & 0xFF).to_bytes(1, 'little')
+        if carries_miso and result > 0:
+            payload += self.expander.miso
+        await asyncio.sleep(self.config.connection_interval)
+        self.expander.stats.round_trips.append(time.monotonic() - started_at)
+        if self.is_connected:
+            self.notify(self.result.handle, bytearray(payload))
+
+    async def write_gatt_char(self, characteristic: FakeCharacteristic, data, response: bool = False):
+        started_at = time.monotonic()
+        data = bytes(data)
+        await asyncio.sleep(self.config.connection_interval)
+
+        match characteristic.uuid:
+            case expander.DATA_BUNDLE_UUID:
+                result = self.expander.run_bundle(data)
+                carries_miso = self.config.result_carries_miso
+            case expander.LOCK_UUID:
+                result, carries_miso = self.expander.set_lock(data), False
+            case _:
+                result, carries_miso = expander.ID_MAP[characteristic.uuid], False
+
+        self._spawn(self._respond(result, started_at, carries_miso))
+
+    async def read_gatt_char(self, characteristic: FakeCharacteristic, response: bool = False):
+        await asyncio.sleep(2 * self.config.connection_interval)
+        if characteristic.uuid == expander.MISO_UUID:
+            return bytearray(self.expander.miso)
+        return bytearray()
+
+
+class SimulatedServiceManager(ServiceManager):
+    client_factory = SimulatedHubClient
+
+
+@contextlib.contextmanager
+def patched(cls, **attributes):
+    """Set class attributes for the duration of the block, restoring the previous values afterwards"""
+    previous = {name: cls.__dict__[name] for name in attributes if name in cls.__dict__}
+    for name, value in attributes.items():
+        setattr(cls, name, value)
+    try:
+        yield
+    finally:
+        for name in attributes:
+            if name in previous:
+                setattr(cls, name, previous[name])
+            else:
+                delattr(cls, name)
+
+
+async def simulate(hubs: int, config: SimulationConfig, duration: float) -> list[SimulatedHubClient]:
+    with (
+        patched(SimulatedHubClient, config=config),
+        patched(
+            ExpanderService,
+            result_carries_miso=config.result_carries_miso,
+            inline_transfer_delay=config.inline_transfer_delay,
+            lease_locks=config.lease_locks,
+        ),
+        patched(
+            ScdService,
+            measurement_interval=60.0 * config.time_scale,
+            data_ready_poll_interval=1.0 * config.time_scale,
+        ),
+    ):
+        managers = [
+            SimulatedServiceManager(f'5B:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}', labels={'device': f'sim-{i}'})
+            for i in range(hubs)
+        ]
+        await asyncio.gather(*(manager.subscribe_all() for manager in managers))
+        await asyncio.sleep(duration)
+        clients = [manager.client for manager in managers]
+        for client in clients:
+            await client.disconnect()
+        # let the measurement loops notice the disconnect
+        await asyncio.sleep(0.1)
+    return clients
+
+
+def report(name: str, hubs: int, clients: list[SimulatedHubClient], duration: float):
+    measurements = sum(client.scd41.commands[scd.READ_MEASUREMENT] for client in clients)
+    polls = sum(client.scd41.commands[scd.DATA_READY] for client in clients)
+    stats = [client.expander.stats for client in clients]
+    bundles = sum(stat.bundles for stat in stats)
+    lock_writes = sum(stat.lock_writes for stat in stats)
+    round_trips = [round_trip for stat in stats for round_trip in stat.round_trips]
+    lock_held = sum(stat.lock_held for stat in stats) / (hubs * duration)
+    per_measurement = max(measurements, 1)
+    print(
+        f'{name:>22} {hubs:4d} {measurements:6d} {bundles / per_measurement:8.1f} {polls / per_measurement:6.1f} '
+        f'{lock_writes / per_measurement:6.1f} {sum(stat.lock_conflicts for stat in stats):9d} '
+        f'{statistics.mean(round_trips) * 1000:7.1f}ms {lock_held * 100:5.1f}%'
+    )
+
+
+async def main():
+    logger.remove()
+    duration = 10.0
+    scenarios = {
+        'baseline firmware': SimulationConfig(time_scale=0.05, connect_time=0.05),
+        'inline delay + MISO': SimulationConfig(
+            time_scale=0.05, connect_time=0.05, result_carries_miso=True, inline_transfer_delay=True,
+            lease_locks=True,
+        ),
+    }
+    print(
+        f'{"firmware":>22} {"hubs":>4} {"reads":>6} {"bundles":>8} {"polls":>6} {"locks":>6} {"conflicts":>9} '
+        f'{"rtt":>9} {"held":>6}   (per SCD41 measurement)'
+    )
+    for hubs in (1, 10, 50):
+        for name, config in scenarios.items():
+            # SCD4X prints the serial number of every sensor
+            with contextlib.redirect_stdout(io.StringIO()):
+                clients = await simulate(hubs, config, duration)
+            report(name, hubs, clients, duration)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
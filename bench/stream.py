@@ -0,0 +1,78 @@
+"""
+Throughput of streamed SPI transfers through a fake expander link.
+
+Every write and read costs one connection event and the result notification arrives one event
+after its write, so the numbers show the round-trip structure rather than real radio speed.
+
+    python -m bench.stream
+"""
+import asyncio
+
+from loguru import logger
+from prometheus_client import CollectorRegistry
+
+from bench.fakes import FakeClient, fake_service
+from service import expander
+from service.expander import ExpanderService
+
+CONNECTION_INTERVAL = 0.0075
+PAYLOAD_SIZE = 4096
+
+
+class FakeExpanderClient(FakeClient):
+    def __init__(self, mtu_size: int):
+        super().__init__()
+        self.mtu_size = mtu_size
+        self.miso = b''
+        self.carries_miso = False
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        await asyncio.sleep(CONNECTION_INTERVAL)
+        data = bytes(data)
+        # the SPI slave echoes MOSI back
+        self.miso = data[expander.BUNDLE_HEADER_SIZE:]
+        result = bytes([expander.ID_MAP[characteristic.uuid]])
+        if self.carries_miso and characteristic.uuid == expander.DATA_BUNDLE_UUID:
+            result += self.miso
+        asyncio.get_running_loop().call_later(CONNECTION_INTERVAL, self.notify, 6, bytearray(result))
+
+    async def read_gatt_char(self, characteristic, response=False):
+        await asyncio.sleep(2 * CONNECTION_INTERVAL)
+        return bytearray(self.miso)
+
+
+async def run(mtu_size: int, carries_miso: bool) -> float:
+    client = FakeExpanderClient(mtu_size)
+    client.carries_miso = carries_miso
+    service = fake_service(
+        expander.DATA_BUNDLE_UUID,
+        [expander.DATA_BUNDLE_UUID, expander.MISO_UUID, expander.CS_UUID, expander.LOCK_UUID,
+         expander.POWER_UUID, expander.RESULT_UUID],
+    )
+    for characteristic in service.characteristics:
+        characteristic.max_write_without_response_size = mtu_size - expander.ATT_HEADER_SIZE
+
+    expander_service = ExpanderService(client, service, CollectorRegistry())
+    expander_service.result_carries_miso = carries_miso
+    await expander_service.subscribe()
+
+    payload = bytearray(i & 0xFF for i in range(PAYLOAD_SIZE))
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    miso = await expander_service.xfer_stream(payload)
+    elapsed = loop.time() - started_at
+    assert miso == payload
+    return PAYLOAD_SIZE / elapsed
+
+
+async def main():
+    logger.remove()
+    print(f'{PAYLOAD_SIZE} B transfer, {CONNECTION_INTERVAL * 1000:.1f} ms connection interval')
+    for mtu_size in (65, 185, 247):
+        sequential = await run(mtu_size, carries_miso=False)
+        pipelined = await run(mtu_size, carries_miso=True)
+        print(f'MTU {mtu_size:3d}: bundle + MISO read {sequential:8.0f} B/s, pipelined {pipelined:8.0f} B/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
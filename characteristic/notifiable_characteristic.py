@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from typing import Optional, Any
+from weakref import WeakKeyDictionary
 
 from loguru import logger
 from prometheus_client.metrics import MetricWrapperBase
@@ -10,17 +11,46 @@ if TYPE_CHECKING:
     from service.state import ServiceState
 
 
+# per metric, the generation of each series by its label values, bumped whenever the series is removed;
+# weakly keyed so that the entries go away with the metric
+SERIES_GENERATIONS: WeakKeyDictionary[MetricWrapperBase, dict[tuple, int]] = WeakKeyDictionary()
+
+
 class MetricResetMixin:
     label_dict: dict
     metric: MetricWrapperBase
+    # labeled child bound on the first set after init or reset, so updates skip labels(**label_dict)
+    _child = None
+    # label values of _child, in the order of the metric's label names, which is the order of label_dict
+    _label_values: tuple = ()
+    # series generations of the metric, and the generation of the series when _child was bound;
+    # another holder of the same labels may remove it
+    _generations: Optional[dict[tuple, int]] = None
+    _generation = 0
+
+    def set_metric(self, value):
+        child = self._child
+        if child is None or self._generation != self._generations.get(self._label_values, 0):
+            self._label_values = tuple(self.label_dict.values())
+            self._generations = SERIES_GENERATIONS.setdefault(self.metric, {})
+            self._generation = self._generations.get(self._label_values, 0)
+            child = self._child = self.metric.labels(*self._label_values)
+        child.set(value)
 
     def reset(self):
-        label_values = frozenset(self.label_dict.values())
-        with self.metric._lock:
-            self.metric._metrics = {
-                k: v for k, v in self.metric._metrics.items()
-                if frozenset(k) != label_values
-            }
+        if self._child is None:
+            # nothing was exported since the last reset
+            return
+
+        self._child = None
+        try:
+            self.metric.remove(*self._label_values)
+        except KeyError:
+            logger.debug(f'Series {self.label_dict} of {self.metric._name} is already removed')
+            return
+
+        # children cached by other holders of these labels now point at the removed series
+        self._generations[self._label_values] = self._generations.get(self._label_values, 0) + 1
 
 
 class DisplayMixin:
@@ -44,7 +74,7 @@ class NotifiableCharacteristic(MetricResetMixin, DisplayMixin):
         self.value = self.post_process_fn(self.value)
 
         if self.value is not None:
-            self.metric.labels(**self.label_dict).set(self.value)
+            self.set_metric(self.value)
         else:
             self.reset()
 
@@ -60,10 +90,12 @@ class DerivedMetric(MetricResetMixin, DisplayMixin):
 
     @logger.catch
     def update_value(self, state: 'ServiceState', notifiable_characteristic: NotifiableCharacteristic):
-        self.value = self.value_fn(state, notifiable_characteristic)
-        self.value = self.post_process_fn(self.value)
+        self.set_value(self.value_fn(state, notifiable_characteristic))
+
+    def set_value(self, value: Optional[Any]):
+        self.value = self.post_process_fn(value)
 
         if self.value is not None:
-            self.metric.labels(**self.label_dict).set(self.value)
+            self.set_metric(self.value)
         else:
             self.reset()
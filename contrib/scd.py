@@ -1,3 +1,4 @@
+import asyncio
 import struct
 import time
 
@@ -28,21 +29,32 @@ DEFAULT_I2C_ADDRESS = 0x62
 
 
 class SCD4X:
+    """
+    Async port of the Pimoroni SCD4X driver for a bus with awaitable i2c_rdwr, e.g. ExpanderService.
+    Build it with ``await SCD4X.create(bus)``: the constructor itself does no I/O.
+    """
+
     def __init__(self, bus, address=DEFAULT_I2C_ADDRESS, quiet=True):
         self.co2 = 0
         self.temperature = 0
         self.relative_humidity = 0
         self.address = address
         self.bus = bus
+        self.quiet = quiet
 
-        self.stop_periodic_measurement()
+    @classmethod
+    async def create(cls, bus, address=DEFAULT_I2C_ADDRESS, quiet=True):
+        scd = cls(bus, address=address, quiet=quiet)
+        await scd.stop_periodic_measurement()
 
-        serial = self.get_serial_number()
+        serial = await scd.get_serial_number()
 
         if not quiet:
             print(f"SCD4X, Serial: {serial:06x}")
 
-    def rdwr(self, command, value=None, response_length=0, delay=0):
+        return scd
+
+    async def rdwr(self, command, value=None, response_length=0, delay=0):
         if value is not None:
             msg_w = i2c_msg.write(
                 self.address, struct.pack(">HHB", command, value, self.crc8(value))
@@ -50,15 +62,15 @@ class SCD4X:
         else:
             msg_w = i2c_msg.write(self.address, struct.pack(">H", command))
 
-        self.bus.i2c_rdwr(msg_w)
-
-        time.sleep(delay / 1000.0)
-
         response_length *= 3
 
-        if response_length > 0:
+        if response_length == 0:
+            await self.bus.i2c_rdwr(msg_w)
+            await asyncio.sleep(delay / 1000.0)
+        else:
+            # one transaction, so the bus can pack the command and its response into a single exchange
             msg_r = i2c_msg.read(self.address, response_length)
-            self.bus.i2c_rdwr(msg_r)
+            await self.bus.i2c_rdwr(msg_w, i2c_msg.delay(delay), msg_r)
 
             result = list(msg_r)
             data = []
@@ -73,85 +85,85 @@ class SCD4X:
 
         return []
 
-    def reset(self):
+    async def reset(self):
         """Resets to user settings from EEPROM"""
-        self.rdwr(SOFT_RESET, delay=20)
+        await self.rdwr(SOFT_RESET, delay=20)
 
-    def factory_reset(self):
+    async def factory_reset(self):
         """Reset to factory fresh condition.
 
         Resets user config in EEPROM.
 
         """
-        self.stop_periodic_measurement()
-        self.rdwr(FACTORY_RESET, delay=1200)
+        await self.stop_periodic_measurement()
+        await self.rdwr(FACTORY_RESET, delay=1200)
 
-    def self_test(self):
-        self.stop_periodic_measurement()
-        response = self.rdwr(SELF_TEST, response_length=1, delay=10000)
+    async def self_test(self):
+        await self.stop_periodic_measurement()
+        response = await self.rdwr(SELF_TEST, response_length=1, delay=10000)
         if response > 0:
             raise RuntimeError("Self test failed!")
 
-    def measure(self, blocking=True, timeout=10):
-        t_start = time.time()
-        while not self.data_ready():
+    async def measure(self, blocking=True, timeout=10, poll_interval=0.1):
+        t_start = time.monotonic()
+        while not await self.data_ready():
             if not blocking:
                 return
-            if time.time() - t_start > timeout:
+            if time.monotonic() - t_start > timeout:
                 raise RuntimeError("Timeout waiting for data ready.")
-            time.sleep(0.1)
+            await asyncio.sleep(poll_interval)
 
-        response = self.rdwr(READ_MEASUREMENT, response_length=3, delay=1)
+        response = await self.rdwr(READ_MEASUREMENT, response_length=3, delay=1)
         self.co2 = response[0]
         self.temperature = -45 + 175.0 * response[1] / (1 << 16)
         self.relative_humidity = 100.0 * response[2] / (1 << 16)
 
         return self.co2, self.temperature, self.relative_humidity, time.time()
 
-    def data_ready(self):
-        response = self.rdwr(DATA_READY, response_length=1, delay=1)
+    async def data_ready(self):
+        response = await self.rdwr(DATA_READY, response_length=1, delay=1)
         return (response & 0x07FF) != 0
 
-    def get_serial_number(self):
-        response = self.rdwr(SERIAL_NUMBER, response_length=3, delay=1)
+    async def get_serial_number(self):
+        response = await self.rdwr(SERIAL_NUMBER, response_length=3, delay=1)
         return (response[0] << 32) | (response[1] << 16) | response[2]
 
-    def start_periodic_measurement(self, low_power=False):
+    async def start_periodic_measurement(self, low_power=False):
         if low_power:
-            self.rdwr(START_LOW_POWER_PERIODIC_MEASUREMENT)
+            await self.rdwr(START_LOW_POWER_PERIODIC_MEASUREMENT)
         else:
-            self.rdwr(START_PERIODIC_MEASUREMENT)
+            await self.rdwr(START_PERIODIC_MEASUREMENT)
 
-    def stop_periodic_measurement(self):
-        self.rdwr(STOP_PERIODIC_MEASUREMENT, delay=500)
+    async def stop_periodic_measurement(self):
+        await self.rdwr(STOP_PERIODIC_MEASUREMENT, delay=500)
 
-    def set_ambient_pressure(self, ambient_pressure):
-        self.rdwr(SET_PRESSURE, value=ambient_pressure)
+    async def set_ambient_pressure(self, ambient_pressure):
+        await self.rdwr(SET_PRESSURE, value=ambient_pressure)
 
-    def set_temperature_offset(self, temperature_offset):
+    async def set_temperature_offset(self, temperature_offset):
         if temperature_offset > 374:
             raise ValueError("Temperature offset must be <= 374c")
         offset = int(temperature_offset * (1 << 16) / 175)
-        self.rdwr(SET_TEMP_OFFSET, value=offset)
+        await self.rdwr(SET_TEMP_OFFSET, value=offset)
 
-    def get_temperature_offset(self):
-        response = self.rdwr(GET_TEMP_OFFSET, response_length=1, delay=1)
+    async def get_temperature_offset(self):
+        response = await self.rdwr(GET_TEMP_OFFSET, response_length=1, delay=1)
         return 175.0 * response / (1 << 16)
 
-    def set_altitude(self, altitude):
-        self.rdwr(SET_ALTITUDE, value=altitude)
+    async def set_altitude(self, altitude):
+        await self.rdwr(SET_ALTITUDE, value=altitude)
 
-    def get_altitude(self):
-        return self.rdwr(GET_ALTITUDE, response_length=1, delay=1)
+    async def get_altitude(self):
+        return await self.rdwr(GET_ALTITUDE, response_length=1, delay=1)
 
-    def set_automatic_self_calibration_enabled(self, value):
-        self.rdwr(SET_ASCE, value=int(value))
+    async def set_automatic_self_calibration_enabled(self, value):
+        await self.rdwr(SET_ASCE, value=int(value))
 
-    def get_automatic_self_calibration_enabled(self):
-        return bool(self.rdwr(GET_ASCE, response_length=1, delay=1))
+    async def get_automatic_self_calibration_enabled(self):
+        return bool(await self.rdwr(GET_ASCE, response_length=1, delay=1))
 
-    def persist_settings(self):
-        self.rdwr(PERSIST_SETTINGS, delay=800)
+    async def persist_settings(self):
+        await self.rdwr(PERSIST_SETTINGS, delay=800)
 
     def crc8(self, data, polynomial=0x31):
         if isinstance(data, int):
@@ -1,46 +1,105 @@
+import struct
+from typing import Callable, Optional
+
+INT_CODES = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+FLOAT_CODES = {2: 'e', 4: 'f', 8: 'd'}
+
+
 def compute_r(c, m, d, b):
     if m < -10 or m > 10:
         raise ValueError("Multiplier should be between -10 and +10")
     return c * m * (10 ** d) * (2 ** b)
 
 
-def deserialize_voltage(data: bytearray):
-    value = int.from_bytes(data, byteorder='little', signed=False)
-    return compute_r(value, 1, 0, -6)
-
-
-def deserialize_int(data: bytearray):
-    return int.from_bytes(data, byteorder='little', signed=False)
-
-
-def deserialize_float(data: bytearray):
-    import struct
-    value = struct.unpack('f', data)
-    return value[0]
+class Codec:
+    """
+    Little-endian GATT value format R = C * M * 10^d * 2^b, compiled once into a struct.Struct
+    and a constant multiplier. Integer values of another width than the declared one (firmware versions differ)
+    get their own unpacker on first sight; floats must have the declared width.
+    """
+
+    def __init__(
+            self, name: str, width: int, signed: bool = False, m: int = 1, d: int = 0, b: int = 0,
+            floating: bool = False
+    ):
+        self.name = name
+        self.width = width
+        self.signed = signed
+        self.floating = floating
+        multiplier = compute_r(1, m, d, b)
+        # None keeps integers integers
+        self.multiplier: Optional[float] = None if multiplier == 1 else multiplier
+        self.struct = self.compile(width)
+        self._unpackers: dict[int, Callable] = {width: self.struct.unpack}
+
+    def compile(self, width: int) -> Optional[struct.Struct]:
+        code = (FLOAT_CODES if self.floating else INT_CODES).get(width)
+        if code is None:
+            return None
+        if not self.signed and not self.floating:
+            code = code.upper()
+        return struct.Struct('<' + code)
+
+    def _unpacker(self, width: int) -> Callable:
+        if self.floating:
+            # a float of another width is a different format, e.g. half precision, not a wider or narrower value
+            raise struct.error(f'{self.name}: expected {self.width} bytes, got {width}')
+
+        compiled = self.compile(width)
+        if compiled is not None:
+            unpack = compiled.unpack
+        else:
+            def unpack(data):
+                return int.from_bytes(data, byteorder='little', signed=self.signed),
+
+        self._unpackers[width] = unpack
+        return unpack
+
+    def __call__(self, data: bytearray):
+        try:
+            unpack = self._unpackers[len(data)]
+        except KeyError:
+            unpack = self._unpacker(len(data))
+
+        value = unpack(data)[0]
+        if self.multiplier is None:
+            return value
+        return value * self.multiplier
+
+    def encode(self, value) -> bytes:
+        if self.multiplier is not None:
+            value = value / self.multiplier
+        if not self.floating:
+            value = round(value)
+        return self.struct.pack(value)
+
+    def __repr__(self):
+        return f'Codec({self.name})'
 
 
 def deserialize_noop(data):
     return data
 
 
-def deserialize_temperature(data: bytearray):
-    value = int.from_bytes(data, byteorder='little', signed=True)
-    value = compute_r(value, 1, -2, 0)
-
-    return value
+CODECS: dict[str, Callable] = {'noop': deserialize_noop}
 
 
-def deserialize_pressure(data: bytearray):
-    #  M = 1, d = -1, b = 0
-    value = int.from_bytes(data, byteorder='little', signed=True)
-    value = compute_r(value, 1, -1, 0)
+def register_codec(name: str, width: int, **kwargs) -> Codec:
+    codec = Codec(name, width, **kwargs)
+    CODECS[name] = codec
+    return codec
 
-    return value
 
+def get_codec(name: str) -> Callable:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f'Unknown codec {name}') from None
 
-def deserialize_humidity(data: bytearray):
-    # M = 1, d = -2, b = 0
-    value = int.from_bytes(data, byteorder='little', signed=True)
-    value = compute_r(value, 1, -2, 0)
 
-    return value
+register_codec('voltage', 2, b=-6)
+register_codec('int', 4)
+register_codec('float', 4, floating=True)
+register_codec('temperature', 2, signed=True, d=-2)
+register_codec('pressure', 4, signed=True, d=-1)
+register_codec('humidity', 2, signed=True, d=-2)
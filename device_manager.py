@@ -1,23 +1,97 @@
 import asyncio
+import dataclasses
+import time
 from typing import Optional
 
-from bleak import BleakScanner
 from loguru import logger
+from prometheus_client import Gauge, Histogram
 
+from adapters import AdapterPool
+from advertisement import AdvertisementIngest
+from scanner import DeviceScanner, ScanConfig
+from scheduler import ConnectionScheduler
+from service.abstract_service import AbstractService
 from service_manager import ServiceManager
 
+ONBOARDING_QUEUE_DEPTH = Gauge(
+    name='onboarding_queue_depth', documentation='Discovered devices waiting for a connection slot',
+    namespace='sensor_hub', subsystem='collector',
+)
+TIME_TO_FIRST_SAMPLE = Histogram(
+    name='time_to_first_sample', documentation='Time from discovery to the first notification of a device',
+    unit='seconds', namespace='sensor_hub', subsystem='collector',
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, float('inf')),
+)
+
 
 class DeviceManager:
-    def __init__(self, labels_by_address: Optional[dict[str, dict[str, str]]] = None):
+    def __init__(
+            self,
+            labels_by_address: Optional[dict[str, dict[str, str]]] = None,
+            onboarding_workers: int = 4,
+            scan_config: Optional[ScanConfig] = None,
+            scheduler: Optional[ConnectionScheduler] = None,
+            advertisement_ingest: bool = False,
+            connect_devices: bool = True,
+            adapters: Optional[list[str]] = None,
+            adapter_strategy: str = 'connections',
+            coalesce_windows: Optional[dict[type[AbstractService], float]] = None,
+    ):
         self._service_managers: dict[str, ServiceManager] = {}
         self.device_labels = labels_by_address or {}
         self.lock = asyncio.Lock()
+        # connect + GATT discovery run concurrently up to the adapter's connection limit
+        self.onboarding_workers = onboarding_workers
+        self.onboarding_queue: asyncio.Queue[str] = asyncio.Queue()
+        self._enqueued_at: dict[str, float] = {}
+        self._workers: list[asyncio.Task] = []
+        # time-shares connection slots instead of keeping every device connected
+        self.scheduler = scheduler
+        # experimental, see advertisement.py: decode advertised values without a connection;
+        # connect_devices=False leaves ingest as the only source
+        self.advertisement_ingest = AdvertisementIngest(self.labels_for) if advertisement_ingest else None
+        self.connect_devices = connect_devices
+        # passed to every ServiceManager, see ServiceManager.coalesce_windows
+        self.coalesce_windows = coalesce_windows
+        # spread connections across several hci adapters and scan on all of them
+        self.adapter_pool = AdapterPool(adapters, strategy=adapter_strategy) if adapters else None
+        scan_config = scan_config or ScanConfig()
+        if adapters and not scan_config.adapters:
+            # a copy: the caller's config may be shared with other scanners
+            scan_config = dataclasses.replace(scan_config, adapters=list(adapters))
+        self.scanner = DeviceScanner(
+            scan_config,
+            on_device=lambda device, _: self.enqueue(device.address),
+            on_advertisement=self.advertisement_ingest.ingest if self.advertisement_ingest else None,
+            adapter_pool=self.adapter_pool,
+        )
+
+    def labels_for(self, address: str) -> dict[str, str]:
+        return {**self.device_labels.get(address, {}), 'device': address}
+
+    def create_manager(self, address: str) -> ServiceManager:
+        adapter = self.adapter_pool.acquire(address) if self.adapter_pool is not None else None
+        return ServiceManager(
+            address, labels=self.labels_for(address), adapter=adapter, coalesce_windows=self.coalesce_windows
+        )
+
+    def release_adapter(self, address: str):
+        if self.adapter_pool is not None:
+            self.adapter_pool.release(address)
+
+    def finish_round(self, manager: ServiceManager):
+        """Report how the adapter of a scheduled round did and free it for the next device"""
+        if self.adapter_pool is not None and manager.adapter is not None:
+            if manager.first_sample_at is not None:
+                self.adapter_pool.report_success(manager.adapter)
+            else:
+                self.adapter_pool.report_failure(manager.adapter)
+        self.release_adapter(manager.address)
 
     def _get_or_create_manager(self, address: str) -> ServiceManager:
         manager = self._service_managers.get(address)
-        labels_by_address = self.device_labels.get(address, {})
         if manager is None:
-            manager = ServiceManager(address, labels={**labels_by_address, 'device': address})
+            manager = self.create_manager(address)
             logger.info(f'Created manager for {address}')
             self._service_managers[address] = manager
         return manager
@@ -30,21 +104,52 @@ class DeviceManager:
 
     def remove_manager(self, address: str):
         self._service_managers.pop(address, None)
+        self.release_adapter(address)
+        self.scanner.forget(address)
 
-    async def discover(self):
-        while True:
-            devices = await BleakScanner.discover()
-            logger.info(f'Discovered {len(devices)} devices')
-            for device in devices:
-                # if device.address.lower() != 'FA:6F:EC:EE:4B:36'.lower():
-                #     continue
-                if device.name != 'Sensor Hub BLE':
-                    continue
+    def enqueue(self, device_address: str):
+        if not self.connect_devices:
+            return
+
+        if self.scheduler is not None:
+            self.scheduler.add(device_address)
+            return
+
+        if device_address in self._service_managers or device_address in self._enqueued_at:
+            return
+
+        self._enqueued_at[device_address] = time.monotonic()
+        self.onboarding_queue.put_nowait(device_address)
+        ONBOARDING_QUEUE_DEPTH.set(self.onboarding_queue.qsize())
+
+    def start_onboarding(self):
+        if self._workers:
+            return
+
+        self._workers = [
+            asyncio.create_task(self._onboarding_worker()) for _ in range(self.onboarding_workers)
+        ]
 
-                if device.address in self._service_managers:
-                    continue
+    async def _onboarding_worker(self):
+        while True:
+            device_address = await self.onboarding_queue.get()
+            ONBOARDING_QUEUE_DEPTH.set(self.onboarding_queue.qsize())
+            try:
+                await self.subscribe(device_address)
+            except Exception as e:
+                logger.exception('Failed to onboard {}: {}', device_address, e)
+            finally:
+                self._enqueued_at.pop(device_address, None)
+                self.onboarding_queue.task_done()
 
-                await self.subscribe(device.address)
+    async def discover(self):
+        if self.advertisement_ingest is not None:
+            asyncio.create_task(self.advertisement_ingest.run())
+        if self.scheduler is not None:
+            self.scheduler.start(self.create_manager, self.finish_round)
+        else:
+            self.start_onboarding()
+        await self.scanner.run()
 
     async def subscribe(self, device_address: str):
         async with self.lock:
@@ -55,23 +160,32 @@ class DeviceManager:
                 self.remove_manager(device_address)
                 return
 
-            try:
-                await manager.subscribe_all()
-            except Exception as e:
-                logger.exception('Failed to subscribe: {}', e)
-                self.remove_manager(device_address)
-                return
+        enqueued_at = self._enqueued_at.get(device_address, time.monotonic())
+        manager.on_first_sample = lambda: TIME_TO_FIRST_SAMPLE.observe(time.monotonic() - enqueued_at)
 
-            async def task():
-                try:
-                    logger.info('Waiting for device {} to disconnect', device_address)
-                    await manager.block()
-                except Exception as ex:
-                    logger.exception('Exception: {}', ex, exc_info=True)
-                logger.error('Disconnected from {}', device_address)
+        try:
+            await manager.subscribe_all()
+        except Exception as e:
+            logger.exception('Failed to subscribe: {}', e)
+            if self.adapter_pool is not None and manager.adapter is not None:
+                self.adapter_pool.report_failure(manager.adapter)
+            async with self.lock:
                 self.remove_manager(device_address)
+            return
+
+        if self.adapter_pool is not None and manager.adapter is not None:
+            self.adapter_pool.report_success(manager.adapter)
 
-                async with self.lock:
-                    manager.reset_service_metrics()
+        async def task():
+            try:
+                logger.info('Waiting for device {} to disconnect', device_address)
+                await manager.block()
+            except Exception as ex:
+                logger.exception('Exception: {}', ex, exc_info=True)
+            logger.error('Disconnected from {}', device_address)
+
+            async with self.lock:
+                self.remove_manager(device_address)
+                manager.reset_service_metrics()
 
-            asyncio.create_task(task())
+        asyncio.create_task(task())
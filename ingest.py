@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+INGEST_QUEUE_DEPTH = Gauge(
+    name='ingest_queue_depth', documentation='Notifications waiting to be applied to metrics',
+    namespace='sensor_hub', subsystem='collector',
+)
+INGEST_DROPPED = Counter(
+    name='ingest_dropped', documentation='Notifications dropped because the ingest queue was full',
+    namespace='sensor_hub', subsystem='collector', labelnames=['policy'],
+)
+INGEST_LATENCY = Histogram(
+    name='ingest_latency', documentation='Time from a notification callback until its value is applied',
+    unit='seconds', namespace='sensor_hub', subsystem='collector',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, float('inf')),
+)
+INGEST_BATCH_SIZE = Histogram(
+    name='ingest_batch_size', documentation='Notifications applied per consumer wake-up',
+    namespace='sensor_hub', subsystem='collector',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, float('inf')),
+)
+
+
+class IngestQueue:
+    """
+    Bounded buffer between bleak notification callbacks and metric updates.
+
+    Callbacks only append (handler, characteristic, timestamp, raw bytes); consumer tasks apply them in batches,
+    so deserialization and derived metrics no longer run inside the D-Bus message handler.
+    When the queue is full, 'oldest' drops the longest waiting notification (a newer value supersedes it anyway),
+    'newest' rejects the incoming one.
+    """
+
+    def __init__(self, maxsize: int = 4096, batch_size: int = 64, consumers: int = 1, drop_policy: str = 'oldest'):
+        if drop_policy not in {'oldest', 'newest'}:
+            raise ValueError(f'Unknown drop policy {drop_policy}')
+
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.consumers = consumers
+        self.drop_policy = drop_policy
+        self.queue: deque[tuple[Callable, object, float, bytearray]] = deque()
+        self.not_empty = asyncio.Event()
+        self.dropped = INGEST_DROPPED.labels(policy=drop_policy)
+        self._workers: list[asyncio.Task] = []
+        INGEST_QUEUE_DEPTH.set_function(lambda: len(self.queue))
+
+    def put(self, handler: Callable, characteristic, data: bytearray):
+        if len(self.queue) >= self.maxsize:
+            self.dropped.inc()
+            if self.drop_policy == 'newest':
+                return
+            self.queue.popleft()
+
+        self.queue.append((handler, characteristic, time.monotonic(), data))
+        self.not_empty.set()
+
+    def drain(self, limit: int) -> int:
+        """Apply up to limit queued notifications; returns how many were applied"""
+        queue = self.queue
+        count = min(limit, len(queue))
+        for _ in range(count):
+            handler, characteristic, enqueued_at, data = queue.popleft()
+            try:
+                handler(characteristic, data)
+            except Exception as e:
+                logger.exception(f'Failed to apply notification of {characteristic.uuid}: {e}')
+            INGEST_LATENCY.observe(time.monotonic() - enqueued_at)
+
+        return count
+
+    def purge(self, owner) -> int:
+        """Drop the queued notifications whose handler is bound to owner; returns how many were dropped"""
+        kept = [item for item in self.queue if getattr(item[0], '__self__', None) is not owner]
+        dropped = len(self.queue) - len(kept)
+        if dropped:
+            self.queue.clear()
+            self.queue.extend(kept)
+        return dropped
+
+    async def _consumer(self):
+        while True:
+            if not self.queue:
+                self.not_empty.clear()
+                await self.not_empty.wait()
+
+            INGEST_BATCH_SIZE.observe(self.drain(self.batch_size))
+            # let the callbacks and the other tasks run between batches
+            await asyncio.sleep(0)
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._consumer()) for _ in range(self.consumers)]
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from prometheus_client import Gauge, Histogram
+
+EVENT_LOOP_LAG = Histogram(
+    name='event_loop_lag', documentation='How late the event loop wakes up a sleeping task',
+    unit='seconds', namespace='sensor_hub', subsystem='collector',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, float('inf')),
+)
+EVENT_LOOP_LAG_MAX = Gauge(
+    name='event_loop_lag_max', documentation='Largest event loop lag seen in the last report interval',
+    unit='seconds', namespace='sensor_hub', subsystem='collector',
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.25, report_interval: float = 15.0):
+    """
+    Sleep for interval and record how much later than requested the loop resumed us.
+    Anything blocking the loop, such as a synchronous sleep in a driver, shows up as lag.
+    """
+    lag_max = 0.0
+    reported_at = time.monotonic()
+    while True:
+        started_at = time.monotonic()
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+
+        lag = max(0.0, now - started_at - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        lag_max = max(lag_max, lag)
+
+        if now - reported_at >= report_interval:
+            EVENT_LOOP_LAG_MAX.set(lag_max)
+            lag_max = 0.0
+            reported_at = now
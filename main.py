@@ -4,17 +4,56 @@ from collections import defaultdict
 import prometheus_client
 
 from device_manager import DeviceManager
+from ingest import IngestQueue
+from loop_monitor import monitor_event_loop_lag
+from recorder import NotificationRecorder
+from service.abstract_service import AbstractService
+from service.bme_280 import Bme280Service
+from service.psychrometric_engine import PsychrometricEngine
+from service.state import ServiceState, DerivedMetricsCollector
+
+# solve BME280 psychrometrics for all devices at scrape time instead of in every BLE callback
+USE_PSYCHROMETRIC_ENGINE = True
+# compute derived metrics at scrape time instead of on every notification; only BME280 has any, so this matters
+# with the psychrometric engine off, and is ignored while the engine computes them
+USE_LAZY_DERIVED_METRICS = True
+# apply notifications from a bounded queue instead of inside the bleak callbacks
+USE_INGEST_QUEUE = True
+# directory to record every raw notification to, for debugging hubs and replaying load offline; None disables it
+RECORD_NOTIFICATIONS_TO = None
+# seconds a burst of notifications is collected before derived metrics run once for it, per service class;
+# only BME280 computes derived metrics per notification, and only while the engine is off
+COALESCE_WINDOWS = {} if USE_PSYCHROMETRIC_ENGINE else {Bme280Service: 0.02}
 
 
 async def main():
+    if USE_PSYCHROMETRIC_ENGINE:
+        engine = PsychrometricEngine()
+        Bme280Service.psychrometric_engine = engine
+        # registered before any device gauge so the derived values are fresh when those are collected
+        prometheus_client.REGISTRY.register(engine)
+    elif USE_LAZY_DERIVED_METRICS:
+        collector = DerivedMetricsCollector()
+        ServiceState.derived_metrics_collector = collector
+        prometheus_client.REGISTRY.register(collector)
+
+    if USE_INGEST_QUEUE:
+        ingest_queue = IngestQueue()
+        ServiceState.ingest_queue = ingest_queue
+        ingest_queue.start()
+
+    if RECORD_NOTIFICATIONS_TO is not None:
+        AbstractService.recorder = NotificationRecorder(RECORD_NOTIFICATIONS_TO)
+
     prometheus_client.start_http_server(9090)
+    asyncio.create_task(monitor_event_loop_lag())
     devices = defaultdict(lambda: {
         'room': 'unknown',
         'location': 'unknown',
         'env': 'unknown'
     })
 
-    manager = DeviceManager(labels_by_address=devices)
+    manager = DeviceManager(labels_by_address=devices, coalesce_windows=COALESCE_WINDOWS)
     asyncio.create_task(manager.discover())
     while True:
         # print("where?")
@@ -22,18 +61,18 @@ async def main():
         #     print(address, service_manager, expander)
         #     try:
         #         expander.power_wait = 2
-        #         scd = SCD4X(expander, quiet=False)
-        #         scd.start_periodic_measurement()
-        #         co2, temperature, relative_humidity, _ = scd.measure()
+        #         scd = await SCD4X.create(expander, quiet=False)
+        #         await scd.start_periodic_measurement()
+        #         co2, temperature, relative_humidity, _ = await scd.measure()
         #         print(f'CO2: {co2} ppm, Temperature: {temperature} C, Humidity: {relative_humidity} %rH')
         #
-        #         co2, temperature, relative_humidity, _ = scd.measure()
+        #         co2, temperature, relative_humidity, _ = await scd.measure()
         #         print(f'CO2: {co2} ppm, Temperature: {temperature} C, Humidity: {relative_humidity} %rH')
         #
-        #         co2, temperature, relative_humidity, _ = scd.measure()
+        #         co2, temperature, relative_humidity, _ = await scd.measure()
         #         print(f'CO2: {co2} ppm, Temperature: {temperature} C, Humidity: {relative_humidity} %rH')
         #         await expander.set_lock(False)
-        #         # res = expander.write_read(100, bytearray(range(100)))
+        #         # res = await expander.write_read(100, bytearray(range(100)))
         #         # res = res[:100]
         #         # print('!!!!', res)
         #     except Exception as e:
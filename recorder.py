@@ -0,0 +1,207 @@
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+from loguru import logger
+from prometheus_client import Counter
+
+# Segment: SEGMENT_HEADER, then records until the end of the written data.
+# Record: RECORD_HEADER (monotonic ns, address index, uuid index, payload size) and the payload.
+# A record with the address index STRING_RECORD defines string uuid index as its utf-8 payload instead;
+# every segment starts with the definitions of all strings interned so far, so it can be read on its own.
+SEGMENT_MAGIC = b'SHNL'
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct('<4sH2x')
+RECORD_HEADER = struct.Struct('<QHHH')
+STRING_RECORD = 0xFFFF
+MAX_STRINGS = 0xFFFF
+MAX_PAYLOAD = 0xFFFF
+# seconds between attempts to allocate a segment after the disk ran out of space
+ALLOCATION_RETRY_DELAY = 10.0
+
+RECORDING_FAILURES = Counter(
+    name='recording_failures', documentation='Notifications the recorder failed to write',
+    namespace='sensor_hub', subsystem='collector',
+)
+
+
+class RecordedNotification(NamedTuple):
+    timestamp_ns: int
+    address: str
+    uuid: str
+    data: bytes
+
+
+class NotificationRecorder:
+    """
+    Appends every raw notification to memory-mapped segment files of segment_size bytes.
+    Addresses and UUIDs are interned into 16-bit indices, so a record costs its 14-byte header and the payload.
+    Only the last max_segments segments are kept.
+    """
+
+    def __init__(self, directory: str | Path, segment_size: int = 16 * 1024 * 1024, max_segments: int = 16):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.strings: dict[str, int] = {}
+        self.segment_index = max((index for index, _ in self.segments(self.directory)), default=-1)
+        self.file = None
+        self.mm = None
+        self.offset = 0
+        # set while recording fails, so a full disk logs once rather than on every notification
+        self.failing = False
+        self.retry_at = 0.0
+        try:
+            self.rotate()
+        except OSError as e:
+            # recording starts once a segment can be allocated; notifications are delivered meanwhile
+            logger.error(f'Failed to allocate a notification segment: {e}')
+
+    @staticmethod
+    def segments(directory: str | Path) -> list[tuple[int, Path]]:
+        return sorted(
+            (int(path.stem.rsplit('-', 1)[1]), path) for path in Path(directory).glob('notifications-*.bin')
+        )
+
+    def _segment_path(self, index: int) -> Path:
+        return self.directory / f'notifications-{index:06d}.bin'
+
+    def _close_segment(self):
+        if self.mm is None:
+            return
+        self.mm.flush()
+        self.mm.close()
+        # drop the unused preallocated tail
+        self.file.truncate(self.offset)
+        self.file.close()
+        self.mm = self.file = None
+
+    def rotate(self):
+        """Start the next segment; raises OSError, without a segment to record to, if it cannot be allocated"""
+        self._close_segment()
+        if time.monotonic() < self.retry_at:
+            raise OSError(f'No notification segment until the retry in {self.retry_at - time.monotonic():.0f}s')
+
+        # make room for the new segment before allocating it
+        segments = self.segments(self.directory)
+        for _, old_path in segments[:max(len(segments) - self.max_segments + 1, 0)]:
+            old_path.unlink(missing_ok=True)
+
+        path = self._segment_path(self.segment_index + 1)
+        file = open(path, 'w+b')
+        try:
+            # reserve the blocks: a store into a sparse hole of the mapping raises SIGBUS on a full disk
+            os.posix_fallocate(file.fileno(), 0, self.segment_size)
+        except OSError:
+            file.close()
+            path.unlink(missing_ok=True)
+            self.retry_at = time.monotonic() + ALLOCATION_RETRY_DELAY
+            raise
+
+        self.segment_index += 1
+        self.file = file
+        self.mm = mmap.mmap(self.file.fileno(), self.segment_size)
+        SEGMENT_HEADER.pack_into(self.mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION)
+        self.offset = SEGMENT_HEADER.size
+        for string, index in self.strings.items():
+            self._write_string(string, index)
+        logger.info(f'Recording notifications to {path}')
+
+    def _write_string(self, string: str, index: int):
+        encoded = string.encode()
+        end = self.offset + RECORD_HEADER.size + len(encoded)
+        RECORD_HEADER.pack_into(self.mm, self.offset, time.monotonic_ns(), STRING_RECORD, index, len(encoded))
+        self.mm[self.offset + RECORD_HEADER.size:end] = encoded
+        self.offset = end
+
+    def intern(self, string: str) -> int:
+        index = self.strings.get(string)
+        if index is not None:
+            return index
+        if len(self.strings) >= MAX_STRINGS:
+            raise ValueError('String table of the recorder is full')
+
+        index = self.strings[string] = len(self.strings)
+        if self.mm is None or self.offset + RECORD_HEADER.size + len(string.encode()) > self.segment_size:
+            # rotate() writes the definition along with the rest of the table
+            self.rotate()
+        else:
+            self._write_string(string, index)
+        return index
+
+    def record(self, address_index: int, uuid_index: int, data: bytearray):
+        size = len(data)
+        end = self.offset + RECORD_HEADER.size + size
+        if self.mm is None or end > self.segment_size:
+            if size > MAX_PAYLOAD or RECORD_HEADER.size + size > self.segment_size - SEGMENT_HEADER.size:
+                logger.warning(f'Not recording a notification of {size} bytes')
+                return
+            self.rotate()
+            end = self.offset + RECORD_HEADER.size + size
+
+        RECORD_HEADER.pack_into(self.mm, self.offset, time.monotonic_ns(), address_index, uuid_index, size)
+        self.mm[end - size:end] = data
+        self.offset = end
+
+    def wrap(self, address: str, callback: Callable) -> Callable:
+        """Record the notifications of a device before handing them to callback; recording never drops one"""
+        address_index = None
+        uuid_indices: dict[int, int] = {}
+        record = self.record
+
+        def recording_callback(characteristic, data: bytearray):
+            nonlocal address_index
+            try:
+                if address_index is None:
+                    address_index = self.intern(address)
+                uuid_index = uuid_indices.get(characteristic.handle)
+                if uuid_index is None:
+                    uuid_index = uuid_indices[characteristic.handle] = self.intern(characteristic.uuid)
+                record(address_index, uuid_index, data)
+            except Exception as e:
+                RECORDING_FAILURES.inc()
+                if not self.failing:
+                    self.failing = True
+                    logger.exception('Failed to record a notification of {}: {}', address, e)
+            else:
+                self.failing = False
+            callback(characteristic, data)
+
+        return recording_callback
+
+    def close(self):
+        self._close_segment()
+
+
+def read_segment(path: str | Path) -> Iterator[RecordedNotification]:
+    strings: dict[int, str] = {}
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version = SEGMENT_HEADER.unpack_from(data, 0)
+    if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+        raise ValueError(f'{path} is not a notification log of version {SEGMENT_VERSION}')
+
+    offset = SEGMENT_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        timestamp_ns, address_index, uuid_index, size = RECORD_HEADER.unpack_from(data, offset)
+        # the zeroed tail of a segment that was not closed cleanly
+        if timestamp_ns == 0:
+            break
+        offset += RECORD_HEADER.size
+        payload = data[offset:offset + size]
+        offset += size
+
+        if address_index == STRING_RECORD:
+            strings[uuid_index] = payload.decode()
+            continue
+        yield RecordedNotification(timestamp_ns, strings[address_index], strings[uuid_index], payload)
+
+
+def read_log(directory: str | Path) -> Iterator[RecordedNotification]:
+    for _, path in NotificationRecorder.segments(directory):
+        yield from read_segment(path)
@@ -0,0 +1,112 @@
+import asyncio
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Optional
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from loguru import logger
+
+from adapters import AdapterPool
+
+
+@dataclass
+class ScanConfig:
+    # a device matches when its name is listed or it advertises any of the service UUIDs
+    names: set[str] = field(default_factory=lambda: {'Sensor Hub BLE'})
+    service_uuids: set[str] = field(default_factory=set)
+    # 'passive' needs platform-specific filters on BlueZ, see BleakScanner
+    scanning_mode: str = 'active'
+    # seconds the radio scans in every scan_interval; scan_window >= scan_interval scans continuously
+    scan_window: float = 10.0
+    scan_interval: float = 10.0
+    # hci adapters to scan on; empty uses the default adapter
+    adapters: list[str] = field(default_factory=list)
+    # seconds to wait before restarting the scanner of an adapter that failed
+    restart_delay: float = 10.0
+
+
+class DeviceScanner:
+    def __init__(
+            self,
+            config: ScanConfig,
+            on_device: Callable[[BLEDevice, AdvertisementData], None],
+            on_advertisement: Optional[Callable[[BLEDevice, AdvertisementData], None]] = None,
+            adapter_pool: Optional[AdapterPool] = None,
+    ):
+        self.config = config
+        self.on_device = on_device
+        # called for every matching advertisement, not only for the first one of a device
+        self.on_advertisement = on_advertisement
+        self.adapter_pool = adapter_pool
+        self.service_uuids = {uuid.lower() for uuid in config.service_uuids}
+        self.seen: set[str] = set()
+
+    def matches(self, device: BLEDevice, advertisement_data: AdvertisementData) -> bool:
+        name = advertisement_data.local_name or device.name
+        if name is not None and name in self.config.names:
+            return True
+
+        return any(uuid.lower() in self.service_uuids for uuid in advertisement_data.service_uuids)
+
+    def forget(self, address: str):
+        """Let the next advertisement of the device through again, e.g. after it disconnected"""
+        self.seen.discard(address)
+
+    def detection_callback(
+            self, device: BLEDevice, advertisement_data: AdvertisementData, adapter: Optional[str] = None
+    ):
+        if not self.matches(device, advertisement_data):
+            return
+
+        if self.adapter_pool is not None:
+            self.adapter_pool.observe(adapter, device.address, advertisement_data.rssi)
+
+        if self.on_advertisement is not None:
+            try:
+                self.on_advertisement(device, advertisement_data)
+            except Exception as e:
+                logger.exception('Failed to ingest advertisement of {}: {}', device.address, e)
+
+        if device.address in self.seen:
+            return
+
+        self.seen.add(device.address)
+        logger.info(f'Detected {device.address} ({advertisement_data.local_name}, rssi={advertisement_data.rssi})')
+        try:
+            self.on_device(device, advertisement_data)
+        except Exception as e:
+            logger.exception('Failed to hand over {}: {}', device.address, e)
+            self.forget(device.address)
+
+    async def run(self):
+        await asyncio.gather(*(self.run_adapter(adapter) for adapter in self.config.adapters or [None]))
+
+    async def run_adapter(self, adapter: Optional[str]):
+        kwargs = {'adapter': adapter} if adapter is not None else {}
+        scanner = BleakScanner(
+            detection_callback=partial(self.detection_callback, adapter=adapter),
+            scanning_mode=self.config.scanning_mode,
+            **kwargs,
+        )
+        continuous = self.config.scan_window >= self.config.scan_interval
+
+        while True:
+            try:
+                await scanner.start()
+            except Exception as e:
+                logger.error(f'Failed to start scanning on {adapter or "default adapter"}: {e}')
+                if self.adapter_pool is not None and adapter is not None:
+                    self.adapter_pool.report_failure(adapter)
+                await asyncio.sleep(self.config.restart_delay)
+                continue
+
+            try:
+                if continuous:
+                    await asyncio.Future()
+                await asyncio.sleep(self.config.scan_window)
+            finally:
+                await scanner.stop()
+
+            await asyncio.sleep(self.config.scan_interval - self.config.scan_window)
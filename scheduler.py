@@ -0,0 +1,160 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from loguru import logger
+from prometheus_client import Gauge
+
+from service_manager import ServiceManager
+
+SCHEDULED_STALENESS = Gauge(
+    name='scheduled_staleness', documentation='Seconds since the last completed round of a scheduled device',
+    unit='seconds', namespace='sensor_hub', subsystem='collector', labelnames=['device'],
+)
+
+
+@dataclass
+class DevicePolicy:
+    # among devices that are due, higher priority is connected first
+    priority: int = 0
+    # a device is due for a new round once its data is this old
+    staleness_target: float = 60.0
+
+
+@dataclass
+class ScheduledDevice:
+    address: str
+    policy: DevicePolicy
+    last_sample_at: Optional[float] = None
+    not_before: float = 0.0
+    busy: bool = False
+    failures: int = 0
+    added_at: float = field(default_factory=time.monotonic)
+    # see ServiceManager.periodic_sessions; kept across the rounds of the device
+    periodic_sessions: set[int] = field(default_factory=set)
+
+    def staleness(self, now: float) -> float:
+        return now - (self.last_sample_at if self.last_sample_at is not None else self.added_at)
+
+    def due_at(self) -> float:
+        if self.last_sample_at is None:
+            return self.not_before
+        return max(self.not_before, self.last_sample_at + self.policy.staleness_target)
+
+
+class ConnectionScheduler:
+    """
+    Time-shares a fixed number of connection slots across a fleet larger than the adapter can hold.
+
+    Every slot repeatedly picks the most overdue idle device, connects, waits for one notification
+    from each of its services (or round_timeout), and disconnects again.
+    """
+
+    def __init__(
+            self,
+            slots: int = 4,
+            round_timeout: float = 15.0,
+            retry_delay: float = 30.0,
+            default_policy: Optional[DevicePolicy] = None,
+            policies: Optional[dict[str, DevicePolicy]] = None,
+    ):
+        self.slots = slots
+        self.round_timeout = round_timeout
+        self.retry_delay = retry_delay
+        self.default_policy = default_policy or DevicePolicy()
+        self.policies = policies or {}
+        self.devices: dict[str, ScheduledDevice] = {}
+        self._schedule_changed = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def add(self, address: str):
+        if address in self.devices:
+            return
+
+        device = ScheduledDevice(address=address, policy=self.policies.get(address, self.default_policy))
+        self.devices[address] = device
+        SCHEDULED_STALENESS.labels(device=address).set_function(lambda: device.staleness(time.monotonic()))
+        self._schedule_changed.set()
+
+    def next_device(self, now: float) -> tuple[Optional[ScheduledDevice], float]:
+        """Most urgent due device, or None and the number of seconds until the next one is due"""
+        best = None
+        best_key = None
+        wait = float('inf')
+        for device in self.devices.values():
+            if device.busy:
+                continue
+
+            due_at = device.due_at()
+            if due_at > now:
+                wait = min(wait, due_at - now)
+                continue
+
+            key = (device.policy.priority, device.staleness(now) / device.policy.staleness_target)
+            if best_key is None or key > best_key:
+                best, best_key = device, key
+
+        return best, wait
+
+    async def run_round(self, device: ScheduledDevice, manager: ServiceManager):
+        try:
+            await manager.subscribe_all()
+            complete = await manager.wait_round(self.round_timeout)
+            if not complete:
+                logger.warning(f'Round of {device.address} timed out after {self.round_timeout} secs')
+        finally:
+            await manager.disconnect()
+
+    async def _slot_worker(
+            self,
+            create_manager: Callable[[str], ServiceManager],
+            release_manager: Optional[Callable[[ServiceManager], None]],
+    ):
+        while True:
+            device, wait = self.next_device(time.monotonic())
+            if device is None:
+                self._schedule_changed.clear()
+                try:
+                    await asyncio.wait_for(self._schedule_changed.wait(), timeout=min(wait, self.retry_delay))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            device.busy = True
+            manager = create_manager(device.address)
+            manager.periodic_sessions = device.periodic_sessions
+            try:
+                await self.run_round(device, manager)
+            except Exception as e:
+                logger.exception('Scheduled round of {} failed: {}', device.address, e)
+            finally:
+                if manager.first_sample_at is not None:
+                    device.last_sample_at = manager.first_sample_at
+                    device.failures = 0
+                else:
+                    device.failures += 1
+                    device.not_before = time.monotonic() + min(self.retry_delay * device.failures,
+                                                               10 * self.retry_delay)
+                device.busy = False
+                self._schedule_changed.set()
+                if release_manager is not None:
+                    release_manager(manager)
+
+    def start(
+            self,
+            create_manager: Callable[[str], ServiceManager],
+            release_manager: Optional[Callable[[ServiceManager], None]] = None,
+    ):
+        """release_manager is called with the manager of every finished round, whether or not it sampled"""
+        if self._workers:
+            return
+
+        self._workers = [
+            asyncio.create_task(self._slot_worker(create_manager, release_manager)) for _ in range(self.slots)
+        ]
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
@@ -1,4 +1,5 @@
-from typing import Optional
+import asyncio
+from typing import Optional, TYPE_CHECKING
 
 from bleak import BleakClient
 from bleak.backends.service import BleakGATTService
@@ -7,17 +8,30 @@ from prometheus_client import CollectorRegistry, Gauge
 from prometheus_client.registry import Collector
 
 from characteristic.notifiable_characteristic import NotifiableCharacteristic, DerivedMetric
+from conv import get_codec
 from service.state import ServiceState
 
 import itertools
 
+if TYPE_CHECKING:
+    from recorder import NotificationRecorder
+
 COUNTER_ITERATOR = itertools.count()
 
+# write-only calibration characteristics, nothing to subscribe to
+CALIBRATION_UUIDS = {
+    'a0e4a2ba-1234-4321-0001-00805f9b34fb',
+    'a0e4a2ba-1234-4321-0002-00805f9b34fb',
+    'a0e4a2ba-1234-4321-0003-00805f9b34fb',
+}
+
 
 class AbstractService:
     namespace: str
     subsystem: str
     state: ServiceState
+    # when set, every raw notification is appended to the recorder's log before it is handled
+    recorder: Optional['NotificationRecorder'] = None
 
     counter = 0
 
@@ -71,7 +85,7 @@ class AbstractService:
     def gauge(
             self,
             uuid: str,
-            deserialize_fn: callable,
+            codec: str,
             metric_name: str,
             documentation: str,
             unit: str,
@@ -83,7 +97,7 @@ class AbstractService:
 
         return NotifiableCharacteristic(
             uuid=uuid.lower(),
-            deserialize_fn=deserialize_fn,
+            deserialize_fn=get_codec(codec),
             label_dict=self.labels,
             metric=self.get_or_create_collector(gauge),
             post_process_fn=post_process_fn
@@ -109,19 +123,35 @@ class AbstractService:
     def init_state(self):
         raise NotImplementedError()
 
-    async def subscribe(self):
-        for characteristic in self.service.characteristics:
-            if characteristic.uuid.lower() in {'a0e4a2ba-1234-4321-0001-00805f9b34fb',
-                                               'a0e4a2ba-1234-4321-0002-00805f9b34fb',
-                                               'a0e4a2ba-1234-4321-0003-00805f9b34fb', }:
-                continue
-
-            logger.info(
-                f'[{self.__class__.__name__}] Subscribing to {characteristic.uuid} {characteristic.description}')
-            try:
-                await self.client.start_notify(characteristic, self.state.update_characteristic)
-            except Exception as e:
-                logger.error(f'Failed to subscribe to characteristic {characteristic.uuid}: {e}')
+    async def subscribe(self, semaphore: Optional[asyncio.Semaphore] = None) -> list[tuple[str, Exception]]:
+        """
+        Issue start_notify for all characteristics concurrently, at most as many in flight as the semaphore allows.
+        Returns the (uuid, exception) pairs of the characteristics that failed to subscribe.
+        """
+        semaphore = semaphore or asyncio.Semaphore(1)
+        callback = self.state.handle_notification
+        if self.recorder is not None:
+            callback = self.recorder.wrap(self.labels.get('device', ''), callback)
+
+        async def start_notify(characteristic):
+            async with semaphore:
+                logger.info(
+                    f'[{self.__class__.__name__}] Subscribing to {characteristic.uuid} {characteristic.description}')
+                await self.client.start_notify(characteristic, callback)
+
+        characteristics = [
+            characteristic for characteristic in self.service.characteristics
+            if characteristic.uuid.lower() not in CALIBRATION_UUIDS
+        ]
+        results = await asyncio.gather(*map(start_notify, characteristics), return_exceptions=True)
+
+        failures = []
+        for characteristic, result in zip(characteristics, results):
+            if isinstance(result, Exception):
+                logger.error(f'Failed to subscribe to characteristic {characteristic.uuid}: {result}')
+                failures.append((characteristic.uuid, result))
+
+        return failures
 
     @property
     def display_name(self):
@@ -1,14 +1,18 @@
 import struct
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, TYPE_CHECKING
 
 from loguru import logger
 
-from conv import deserialize_temperature, deserialize_pressure, deserialize_humidity
 from characteristic.notifiable_characteristic import NotifiableCharacteristic
 from service.abstract_service import AbstractService
 from service.state import ServiceState
 from pythermalcomfort.psychrometrics import psy_ta_rh
 
+if TYPE_CHECKING:
+    from service.psychrometric_engine import PsychrometricEngine
+
 
 @dataclass
 class Bme280State(ServiceState):
@@ -25,10 +29,37 @@ class Bme280State(ServiceState):
     enthalpy: NotifiableCharacteristic
 
 
+PSYCHROMETRIC_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=PSYCHROMETRIC_CACHE_SIZE)
+def solve_psychrometrics(temperature: float, humidity: float, pressure: float) -> dict:
+    """
+    Run the psy_ta_rh solver once per distinct (temperature, humidity, pressure) triple.
+    BME280 readings are fixed-point, so stable rooms keep hitting the same keys.
+    """
+    return psychrometric_values_as_dict(psy_ta_rh(tdb=temperature, rh=humidity, p_atm=pressure))
+
+
+def psychrometric_values_as_dict(values) -> dict:
+    if isinstance(values, dict):
+        return values
+
+    # pythermalcomfort>=2.10 returns a dataclass with long field names
+    return {
+        'p_sat': values.p_sat,
+        'p_vap': values.p_vap,
+        'hr': values.hr,
+        't_wb': values.wet_bulb_tmp,
+        't_dp': values.dew_point_tmp,
+        'h': values.h,
+    }
+
+
 def calculate_psychrometric_values(state: Bme280State):
     if None in (state.temperature.value, state.humidity.value, state.pressure.value):
         return {}
-    return psy_ta_rh(tdb=state.temperature.value, rh=state.humidity.value, p_atm=state.pressure.value)
+    return solve_psychrometrics(state.temperature.value, state.humidity.value, state.pressure.value)
 
 
 def enthalpy_value_fn(state, _ch: NotifiableCharacteristic):
@@ -59,57 +90,70 @@ class Bme280Service(AbstractService):
     namespace = 'sensor_hub'
     subsystem = 'bme280'
     state: Bme280State
+    psychrometric_engine: Optional['PsychrometricEngine'] = None
 
     def init_state(self):
+        # with the fleet-wide engine the derived gauges are filled in batches, not from the BLE callback
+        triggered_by = set() if self.psychrometric_engine else {'temperature', 'pressure', 'humidity'}
+
         self.state = Bme280State(
             temperature=self.gauge(
-                uuid='00002a6e-0000-1000-8000-00805f9b34fb', deserialize_fn=deserialize_temperature,
+                uuid='00002a6e-0000-1000-8000-00805f9b34fb', codec='temperature',
                 metric_name='temperature', documentation='BME280 Temperature', unit='degrees_celsius',
             ),
             pressure=self.gauge(
-                uuid='00002a6d-0000-1000-8000-00805f9b34fb', deserialize_fn=deserialize_pressure,
+                uuid='00002a6d-0000-1000-8000-00805f9b34fb', codec='pressure',
                 metric_name='pressure', documentation='BME280 Pressure', unit='pa',
             ),
             humidity=self.gauge(
-                uuid='00002a6f-0000-1000-8000-00805f9b34fb', deserialize_fn=deserialize_humidity,
+                uuid='00002a6f-0000-1000-8000-00805f9b34fb', codec='humidity',
                 metric_name='humidity', documentation='BME280 Humidity', unit='percent',
             ),
             timeout=self.gauge(
-                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', deserialize_fn=deserialize_humidity,
+                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', codec='humidity',
                 metric_name='timeout', documentation='BME280 Timeout', unit='ms',
             ),
             p_sat=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=p_sat_value_fn,
                 metric_name='p_sat', documentation='Saturation Pressure', unit='pa',
             ),
             p_vap=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=p_vap_value_fn,
                 metric_name='p_vap', documentation='Vapor Pressure', unit='pa',
             ),
             hr=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=hr_value_fn,
                 metric_name='hr', documentation='Humidity Ratio', unit='kg_kg',
             ),
             t_wb=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=t_wb_value_fn,
                 metric_name='t_wb', documentation='Wet Bulb Temperature', unit='degrees_celsius',
             ),
             t_dp=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=t_dp_value_fn,
                 metric_name='t_dp', documentation='Dew Point Temperature', unit='degrees_celsius',
             ),
             enthalpy=self.derived_gauge(
-                triggered_by={'temperature', 'pressure', 'humidity'},
+                triggered_by=triggered_by,
                 value_fn=enthalpy_value_fn,
                 metric_name='enthalpy', documentation='Enthalpy', unit='joule',
             )
         )
 
+        if self.psychrometric_engine is not None:
+            self.psychrometric_engine.register(self)
+
+    def reset_state_metrics(self):
+        # unregister first: once it returns, a scrape in progress no longer writes this service's series
+        if self.psychrometric_engine is not None:
+            self.psychrometric_engine.unregister(self)
+        super().reset_state_metrics()
+
     async def set_timeout_ms(self, timeout: int):
         ch = self.service.get_characteristic(self.state.timeout.uuid)
         data = timeout.to_bytes(4, 'little', signed=False)
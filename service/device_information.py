@@ -4,10 +4,11 @@ from bleak import BleakGATTCharacteristic
 from loguru import logger
 
 from characteristic.notifiable_characteristic import NotifiableCharacteristic
-from conv import deserialize_voltage, deserialize_temperature, deserialize_int
 from service.abstract_service import AbstractService
 from service.state import ServiceState
 
+LOG_UUID = '00002bde-0000-1000-8000-00805f9b34fb'
+
 
 @dataclass
 class DeviceInformationState(ServiceState):
@@ -17,7 +18,7 @@ class DeviceInformationState(ServiceState):
 
     @logger.catch
     def update_characteristic(self, characteristic: BleakGATTCharacteristic, data: bytearray):
-        if characteristic.uuid.lower() == '00002bde-0000-1000-8000-00805f9b34fb'.lower():
+        if characteristic.uuid.lower() == LOG_UUID:
             value = data.strip(b'\x00').decode('utf-8')
             logger.warning(value)
         else:
@@ -32,15 +33,15 @@ class DeviceInformationService(AbstractService):
     def init_state(self):
         self.state = DeviceInformationState(
             battery_voltage=self.gauge(
-                uuid='00002b18-0000-1000-8999-00805f9b34fb', deserialize_fn=deserialize_voltage,
+                uuid='00002b18-0000-1000-8999-00805f9b34fb', codec='voltage',
                 metric_name='battery_voltage', documentation='Battery voltage', unit='volts',
             ),
             temperature=self.gauge(
-                uuid='00002a6e-0000-1000-8000-00805f9b34fb', deserialize_fn=deserialize_temperature,
+                uuid='00002a6e-0000-1000-8000-00805f9b34fb', codec='temperature',
                 metric_name='temperature', documentation='Temperature', unit='degrees_celsius',
             ),
             timeout=self.gauge(
-                uuid='00002b18-0002-1000-8000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='00002b18-0002-1000-8000-00805f9b34fb', codec='int',
                 metric_name='timeout', documentation='Timeout', unit='seconds',
             ),
         )
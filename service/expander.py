@@ -1,17 +1,21 @@
 import asyncio
+import contextlib
+import itertools
+import time
 from asyncio import Future
-from dataclasses import dataclass
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from typing import Optional
 
 from bleak import BleakGATTCharacteristic
 from loguru import logger
+from prometheus_client import Histogram, Counter
 
 from characteristic.notifiable_characteristic import NotifiableCharacteristic
 from service.abstract_service import AbstractService
 from service.state import ServiceState
 
-import nest_asyncio
-
 DATA_BUNDLE_UUID = "0000a001-0000-1000-8000-00805f9b34fb"
 MISO_UUID = "0000a002-0000-1000-8000-00805f9b34fb"
 CS_UUID = "0000a003-0000-1000-8000-00805f9b34fb"
@@ -45,22 +49,36 @@ ID_NAME_MAP = {
     8: 'ADDRESS',
 }
 
-nest_asyncio.apply()
-
-
-def log_runtime(func):
-    from functools import wraps
-    import time
-
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        start = time.perf_counter()
-        value = func(*args, **kwargs)
-        end = time.perf_counter()
-        logger.info(f'Finished {func.__name__!r} in {end - start:.4f} secs')
-        return value
+# Errors report the ids of ID_NAME_MAP, which differ from the command ids of ID_MAP that successes report.
+# Errors of the bundle fields (command, size, address, ...) belong to a data bundle; a LOCK error is either
+# a data bundle that failed to take the lock or a lock write, whichever is older.
+ERROR_COMMAND_IDS = {
+    1: (ID_MAP[DATA_BUNDLE_UUID],),
+    2: (ID_MAP[CS_UUID],),
+    4: (ID_MAP[DATA_BUNDLE_UUID], ID_MAP[LOCK_UUID]),
+    6: (ID_MAP[POWER_UUID],),
+}
 
-    return wrapper
+BUNDLE_HEADER_SIZE = 16
+# lock_set bit of the bundle control byte
+LOCK_SET = 1 << 7
+# ATT header of a write command or a notification
+ATT_HEADER_SIZE = 3
+
+TRANSACTION_ROUND_TRIPS = Histogram(
+    name='transaction_round_trips', documentation='BLE round-trips spent on one i2c_rdwr transaction',
+    namespace='sensor_hub', subsystem='expander',
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, float('inf')),
+)
+STREAM_THROUGHPUT = Histogram(
+    name='stream_throughput', documentation='MOSI bytes per second achieved by a streamed SPI transfer',
+    unit='bytes_per_second', namespace='sensor_hub', subsystem='expander',
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, float('inf')),
+)
+LOCK_ROUND_TRIPS = Counter(
+    name='lock_round_trips', documentation='Explicit lock writes sent to the expander',
+    namespace='sensor_hub', subsystem='expander',
+)
 
 
 def log_runtime_async(func):
@@ -90,19 +108,86 @@ class NoopState(ServiceState):
         pass
 
 
+@dataclass
+class Lease:
+    lock_type: int
+    lease_ms: int
+    # monotonic time after which the next bundle carries the lock again; 0 until a bundle took it successfully
+    renew_at: float = 0.0
+    # a bundle carrying the lock was sent, so the expander may hold it even if the result never arrived
+    requested: bool = False
+
+    @property
+    def held(self) -> bool:
+        return self.renew_at > 0
+
+
 class LockingContext:
-    def __init__(self, service: 'ExpanderService', lock_type: int):
+    """
+    Holds the expander lock across a batch of operations.
+
+    The lock is taken by the first bundle sent inside the context and renewed by a later bundle once half
+    of the lease has passed, so no extra round-trip is spent on acquiring it. Leaving the context releases
+    the lock with a single write; if the host never gets to it, firmware with lease support (lease_locks,
+    a proposed extension) drops the lock after lease_ms. Baseline firmware has no expiry: a host that dies
+    inside a session leaves the lock held until the expander restarts.
+
+    Operations of tasks outside the session wait for it to end (see ExpanderService.exclusive), so they are
+    never sent over a lock another task holds.
+    """
+
+    def __init__(self, service: 'ExpanderService', lock_type: int, lease_ms: int):
         self.service = service
-        self.lock_type = lock_type
+        self.lease = Lease(lock_type, lease_ms)
+        self.token = None
 
     async def __aenter__(self):
-        await self.service.set_lock(self.lock_type)
+        service = self.service
+        await service.session_lock.acquire()
+        try:
+            # operations started outside the session finish first; new ones wait for the session to end
+            async with service.session_changed:
+                await service.session_changed.wait_for(lambda: service.operations == 0)
+        except BaseException:
+            service.session_lock.release()
+            raise
+        # only bundles of this task and the tasks it spawns ride on the lease
+        self.token = CURRENT_SESSION.set(self)
+        return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         try:
-            await self.service.set_lock(0)
+            if self.lease.requested:
+                await self.service.set_lock(0)
         except Exception as e:
             logger.error(f'Failed to release lock: {e}')
+        finally:
+            CURRENT_SESSION.reset(self.token)
+            self.service.session_lock.release()
+            async with self.service.session_changed:
+                self.service.session_changed.notify_all()
+
+
+CURRENT_SESSION: ContextVar[Optional[LockingContext]] = ContextVar('expander_session', default=None)
+
+
+@dataclass
+class RoundTrips:
+    count: int = 0
+
+
+# round-trips of the i2c_rdwr transaction the calling task runs, not of every concurrent operation
+CURRENT_ROUND_TRIPS: ContextVar[Optional[RoundTrips]] = ContextVar('expander_round_trips', default=None)
+
+
+@dataclass
+class PendingCommand:
+    sequence: int
+    command_id: int
+    future: Future
+    registered_at: float = field(default_factory=time.monotonic)
+    # set once the command was abandoned: a result arriving before then is its late result and is dropped
+    expires_at: Optional[float] = None
 
 
 class WaitingContext:
@@ -113,26 +198,29 @@ class WaitingContext:
             raise ValueError(f'Characteristic {uuid} not found')
 
         self.command_id = ID_MAP[uuid.lower()]
+        self.command: Optional[PendingCommand] = None
+        self.result = None
 
     async def __aenter__(self):
-        self.service.future_map[self.command_id] = asyncio.get_running_loop().create_future()
+        await self.service.in_flight.acquire()
+        self.command = self.service.register_command(self.command_id)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is not None:
-            logger.error(f'Exception in WaitingContext: {exc_type} {exc_val} {exc_tb}')
-            return
-
-        fut = self.service.future_map[self.command_id]
-        if fut is None:
-            logger.error(
-                f'Failed to find future for command: {self.command_id}; existing futures: {self.service.future_map}')
-            return
-
         try:
-            await fut
+            if exc_type is not None:
+                logger.error(f'Exception in WaitingContext: {exc_type} {exc_val} {exc_tb}')
+                self.service.discard_command(self.command)
+                return
+
+            try:
+                self.result = await self.command.future
+            except BaseException:
+                # timed out or cancelled after the write: the result may still arrive
+                self.service.abandon_command(self.command)
+                raise
         finally:
-            _ = self.service.future_map.pop(self.command_id)
+            self.service.in_flight.release()
 
 
 class ExpanderService(AbstractService):
@@ -141,16 +229,150 @@ class ExpanderService(AbstractService):
     state: NoopState
     cs: int = 0
     address: int = -1
-    future_map: dict[id, Future] = {}
     lock_timeout: float = 15.0
+    # seconds after a timeout during which a result for the abandoned command is still expected
+    late_result_window: float = 2.0
+    # commands written to the expander and still waiting for their result notification
+    max_in_flight: int = 4
     power_wait: int = 1
     cs_wait: int = 1
+    # The flags below describe proposed firmware extensions. No released firmware implements them, so they are
+    # off by default and the expander speaks the baseline protocol; enable one only for firmware that has it.
+    # firmware honours the write-to-read delay in header byte 13 of a transfer bundle
+    inline_transfer_delay: bool = False
+    # firmware appends the MISO data to the result notification of a data bundle
+    result_carries_miso: bool = False
+    # firmware reads a lock lease in ms from header bytes 14-15 of a bundle and byte 1-2 of a lock write,
+    # and drops a lock whose lease ran out
+    lease_locks: bool = False
+    lease_ms: int = 10_000
+    # MOSI bytes per streamed bundle; None derives it from the negotiated MTU
+    stream_chunk_size: Optional[int] = None
+    round_trips: int = 0
+
+    def __init__(self, *args, **kwargs):
+        # the result notification carries only the command id, so responses are matched in order per command
+        self.pending: dict[int, deque[PendingCommand]] = defaultdict(deque)
+        # command id -> monotonic time a tombstone last consumed a result
+        self.late_results: dict[int, float] = {}
+        self.sequence = itertools.count()
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        # a data bundle and the MISO read of its result must not interleave with another bundle
+        self.miso_lock = asyncio.Lock()
+        self.session_lock = asyncio.Lock()
+        # operations of tasks outside a session that are running; a session starts once there are none
+        self.operations = 0
+        self.session_changed = asyncio.Condition()
+        super().__init__(*args, **kwargs)
 
     def init_state(self):
         self.state = NoopState()
 
-    def pack_data_bundle(
+    def register_command(self, command_id: int) -> PendingCommand:
+        command = PendingCommand(
+            sequence=next(self.sequence),
+            command_id=command_id,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self.pending[command_id].append(command)
+        return command
+
+    def discard_command(self, command: PendingCommand):
+        """Forget a command that was never written, so no result will arrive for it"""
+        try:
+            self.pending[command.command_id].remove(command)
+        except ValueError:
+            pass
+
+    def abandon_command(self, command: PendingCommand):
+        """
+        Give up on a written command. It stays queued as a tombstone for late_result_window seconds,
+        so a result that is late rather than lost is consumed by it instead of resolving the next command
+        of the same id; after that the result is taken to be lost and the tombstone is skipped.
+        """
+        command.future.cancel()
+        if self.late_results.get(command.command_id, 0.0) >= command.registered_at:
+            # a tombstone took a result after this command was written, most likely this command's own;
+            # another tombstone would take the result of the next command as well
+            self.discard_command(command)
+            return
+
+        if command.expires_at is None:
+            command.expires_at = time.monotonic() + self.late_result_window
+
+    def _live_queue(self, command_id: int) -> Optional[deque[PendingCommand]]:
+        """Pending commands of command_id without the expired tombstones at its head"""
+        queue = self.pending.get(command_id)
+        if not queue:
+            return None
+
+        now = time.monotonic()
+        while queue and queue[0].expires_at is not None and queue[0].expires_at <= now:
+            logger.warning(f'Result of command #{queue[0].sequence} ({ID_NAME_MAP.get(command_id, command_id)}) lost')
+            queue.popleft()
+        return queue or None
+
+    def session(self, lock_type: int = 2, lease_ms: Optional[int] = None) -> LockingContext:
+        """
+        async with expander.session():
+            await scd.measure()
+        """
+        return LockingContext(self, lock_type, self.lease_ms if lease_ms is None else lease_ms)
+
+    def current_lease(self) -> Optional[Lease]:
+        """Lease of the session the calling task runs in, if that session is on this expander"""
+        session = CURRENT_SESSION.get()
+        if session is None or session.service is not self:
+            return None
+        return session.lease
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        """
+        Keep an operation out of other tasks' sessions: outside a session it waits for a running or starting
+        session to end, and a session waits for it. Operations outside sessions still run concurrently,
+        and inside a session of this expander they run right away.
+        """
+        if self.current_lease() is not None:
+            yield
+            return
+
+        async with self.session_changed:
+            await self.session_changed.wait_for(lambda: not self.session_lock.locked())
+            self.operations += 1
+        try:
+            yield
+        finally:
+            async with self.session_changed:
+                self.operations -= 1
+                self.session_changed.notify_all()
+
+    def bundle_lock(self, lock_type: int) -> dict:
+        """Lock fields of the next bundle: the given lock outside a session, the lease inside of it"""
+        lease = self.current_lease()
+        if lease is None:
+            return {'lock': lock_type}
+
+        if lease.held and time.monotonic() < lease.renew_at:
+            return {}
+
+        lease.requested = True
+        return {'lock': lease.lock_type, 'lease_ms': lease.lease_ms}
+
+    def renew_lease(self, sent_at: float):
+        """A bundle carrying the lock sent at sent_at succeeded; the lease holds until half of it passed"""
+        lease = self.current_lease()
+        if lease is not None:
+            lease.renew_at = max(lease.renew_at, sent_at + lease.lease_ms / 2000.0)
+
+    def pack_data_bundle(self, mosi: Optional[bytearray] = None, **kwargs) -> bytearray:
+        data = bytearray(BUNDLE_HEADER_SIZE + (len(mosi) if mosi is not None else 0))
+        self.pack_data_bundle_into(data, mosi=mosi, **kwargs)
+        return data
+
+    def pack_data_bundle_into(
             self,
+            data: bytearray,
             lock: Optional[int] = None,
             power: Optional[bool] = None,
             cs: Optional[int] = None,
@@ -161,8 +383,11 @@ class ExpanderService(AbstractService):
             mosi: Optional[bytearray] = None,
             power_wait: int = 0,
             cs_wait: int = 0,
-    ):
+            transfer_delay: int = 0,
+            lease_ms: int = 0,
+    ) -> int:
         """
+        Pack the header and MOSI into the start of data, which must have room for both; returns the bundle size.
         First byte is control bits:
         [lock_set, power_set, cs_set, command_set, address_set, size_read_set, size_write_set, mosi_set]
         Second byte: reserved
@@ -178,15 +403,14 @@ class ExpanderService(AbstractService):
             [8] address,
             [9,10] [size_read, size_read],
             [11, 12] [size_write, size_write],
-            [13] reserved,
-            [14] reserved,
-            [15] reserved,
+            [13] transfer_delay (ms between the write and the read of a transfer),
+            [14, 15] [lease_ms, lease_ms] (only with lease_locks),
             ..mosi
         ]
         """
         control_bits = 0
         if lock is not None:
-            control_bits |= 1 << 7
+            control_bits |= LOCK_SET
         if power is not None:
             control_bits |= 1 << 6
         if cs is not None:
@@ -200,7 +424,7 @@ class ExpanderService(AbstractService):
         if mosi is not None:
             control_bits |= 1 << 0
 
-        data = bytearray(16)
+        data[:BUNDLE_HEADER_SIZE] = bytes(BUNDLE_HEADER_SIZE)
         data[0] = control_bits
         if lock is not None:
             data[2] = lock
@@ -223,45 +447,88 @@ class ExpanderService(AbstractService):
         if size_write is not None:
             data[11] = size_write & 0xFF
             data[12] = (size_write >> 8) & 0xFF
-        if mosi is not None:
-            data[16:] = mosi
+        data[13] = transfer_delay
+        if self.lease_locks:
+            data[14:16] = min(lease_ms, 0xFFFF).to_bytes(2, 'little')
+        if mosi is None:
+            return BUNDLE_HEADER_SIZE
 
-        return data
+        end = BUNDLE_HEADER_SIZE + len(mosi)
+        data[BUNDLE_HEADER_SIZE:end] = mosi
+        return end
 
     @log_runtime_async
     async def set_bundle(self, data: bytearray):
+        self.count_round_trip()
+        sent_at = time.monotonic()
         async with WaitingContext(self, DATA_BUNDLE_UUID) as ctx:
             await self.client.write_gatt_char(ctx.characteristic, data, response=False)
+        if data[0] & LOCK_SET:
+            self.renew_lease(sent_at)
+        return ctx.result
 
     @log_runtime_async
     async def read_miso(self):
+        self.count_round_trip()
         ch = self.service.get_characteristic(MISO_UUID)
         return await self.client.read_gatt_char(ch, response=False)
 
+    def count_round_trip(self):
+        self.round_trips += 1
+        round_trips = CURRENT_ROUND_TRIPS.get()
+        if round_trips is not None:
+            round_trips.count += 1
+
+    async def set_bundle_read_miso(self, data: bytearray):
+        async with self.miso_lock:
+            result = await self.set_bundle(data)
+            if self.result_carries_miso and isinstance(result, (bytes, bytearray)):
+                return result
+            return await self.read_miso()
+
+    async def write_command(self, uuid: str, data: bytes):
+        @with_timeout(self.lock_timeout)
+        async def f():
+            async with WaitingContext(self, uuid) as ctx:
+                await self.client.write_gatt_char(ctx.characteristic, data, response=False)
+
+        async with self.exclusive():
+            return await f()
+
     @log_runtime_async
     async def set_cs(self, cs: int):
-        async with WaitingContext(self, CS_UUID) as ctx:
-            data = cs.to_bytes(1, 'little', signed=False)
-            await self.client.write_gatt_char(ctx.characteristic, data, response=False)
+        await self.write_command(CS_UUID, cs.to_bytes(1, 'little', signed=False))
 
     @log_runtime_async
-    async def set_lock(self, lock_type: int):
-        async with WaitingContext(self, LOCK_UUID) as ctx:
-            data = lock_type.to_bytes(1, 'little', signed=False)
-            await self.client.write_gatt_char(ctx.characteristic, data, response=False)
+    async def set_lock(self, lock_type: int, lease_ms: int = 0):
+        LOCK_ROUND_TRIPS.inc()
+        data = lock_type.to_bytes(1, 'little', signed=False)
+        if self.lease_locks:
+            data += min(lease_ms, 0xFFFF).to_bytes(2, 'little')
+        await self.write_command(LOCK_UUID, data)
 
     @log_runtime_async
     async def set_power(self, on: bool):
-        async with WaitingContext(self, POWER_UUID) as ctx:
-            data = on.to_bytes(1, 'little', signed=False)
-            await self.client.write_gatt_char(ctx.characteristic, data, response=False)
+        await self.write_command(POWER_UUID, on.to_bytes(1, 'little', signed=False))
 
-    async def subscribe(self):
+    async def subscribe(self, semaphore: Optional[asyncio.Semaphore] = None):
         ch = self.service.get_characteristic(RESULT_UUID)
         await self.client.start_notify(ch, self.wait_response)
+        return []
+
+    def _error_queue(self, error_id: int) -> Optional[deque[PendingCommand]]:
+        command_ids = ERROR_COMMAND_IDS.get(error_id, (ID_MAP[DATA_BUNDLE_UUID],))
+        queues = [queue for queue in map(self._live_queue, command_ids) if queue]
+        if not queues:
+            return None
+        return min(queues, key=lambda queue: queue[0].sequence)
 
     def wait_response(self, characteristic: BleakGATTCharacteristic, data: bytearray):
-        result = int.from_bytes(data, byteorder='little', signed=True)
+        payload = None
+        # only a successful data bundle result carries MISO; lock, CS, power and error results are the byte alone
+        if self.result_carries_miso and data and data[0] == ID_MAP[DATA_BUNDLE_UUID]:
+            data, payload = data[:1], bytes(data[1:])
+        result = int.from_bytes(data[:1], byteorder='little', signed=True)
         if result < -100:
             command_id = result + 128
         elif result < 0:
@@ -270,104 +537,237 @@ class ExpanderService(AbstractService):
             command_id = result
 
         is_success = result >= 0
-        future = self.future_map.get(command_id)
-        if future is None:
-            logger.error(f'Failed to find future for command: {command_id}; existing futures: {self.future_map}')
-            for fut in self.future_map.values():
-                fut.set_exception(ValueError(f'Failed to find future for command: {command_id}'))
+        queue = self._live_queue(command_id) if is_success else self._error_queue(command_id)
+        if not queue:
+            logger.error(f'Unexpected result for command {ID_NAME_MAP.get(command_id, command_id)}: {result}')
+            return
+
+        command = queue.popleft()
+        future = command.future
+        if future.done():
+            if command.expires_at is not None:
+                self.late_results[command.command_id] = time.monotonic()
+            logger.warning(f'Late result for command #{command.sequence} ({ID_NAME_MAP.get(command_id, command_id)})')
             return
 
         if is_success:
-            future.set_result(True)
+            future.set_result(payload if payload is not None else True)
             return
 
         future.set_exception(ExpanderError(command_id))
 
-    @log_runtime
-    def xfer(self, buf: bytearray, *args, **kwargs):
+    @log_runtime_async
+    async def xfer(self, buf: bytearray, *args, **kwargs):
         """
         0x00 => Ok(Command::Write),
         0x01 => Ok(Command::Read),
         0x02 => Ok(Command::Transfer),
         """
+        if len(buf) > self.max_chunk_size():
+            return await self.xfer_stream(buf)
 
         @with_timeout(self.lock_timeout)
         async def f():
             bundle = self.pack_data_bundle(
-                lock=1, power=True, command=2, size_write=len(buf), mosi=buf,
+                **self.bundle_lock(1), power=True, command=2, size_write=len(buf), mosi=buf,
                 power_wait=self.power_wait
             )
-            await self.set_bundle(bundle)
-            return await self.read_miso()
+            return await self.set_bundle_read_miso(bundle)
+
+        async with self.exclusive():
+            return await f()
 
-        loop = asyncio.get_running_loop()
-        task = loop.create_task(f())
-        return loop.run_until_complete(task)
+    def max_chunk_size(self) -> int:
+        """MOSI bytes that fit into one bundle write, and into its result notification if that carries MISO"""
+        if self.stream_chunk_size is not None:
+            return self.stream_chunk_size
+
+        characteristic = self.service.get_characteristic(DATA_BUNDLE_UUID)
+        chunk_size = characteristic.max_write_without_response_size - BUNDLE_HEADER_SIZE
+        if self.result_carries_miso:
+            # the first byte of the notification is the result
+            chunk_size = min(chunk_size, self.client.mtu_size - ATT_HEADER_SIZE - 1)
+        return max(chunk_size, 1)
+
+    async def xfer_stream(self, buf: bytearray, chunk_size: Optional[int] = None) -> bytearray:
+        """
+        SPI transfer of a buffer larger than one bundle, one bundle per chunk.
+        The bundle buffer is allocated once and chunks are sliced out of buf without copying.
+        Only the first chunk sets power and CS, with their waits; later chunks leave both as they are, so the
+        frame is not cut between chunks by firmware that keeps CS asserted until a bundle changes it.
+        Firmware that toggles CS around every transfer splits the frame at chunk boundaries.
+        When the result notification carries MISO (a firmware extension), up to max_in_flight chunks are written
+        ahead of the results; with baseline firmware every chunk waits for its own MISO read, since the next
+        bundle overwrites MISO, so streaming then only saves the bundle allocations.
+        """
+        chunk_size = min(chunk_size or self.max_chunk_size(), self.max_chunk_size())
+        characteristic = self.service.get_characteristic(DATA_BUNDLE_UUID)
+        mosi = memoryview(buf)
+        miso = bytearray(len(mosi))
+        bundle = bytearray(BUNDLE_HEADER_SIZE + chunk_size)
+        bundle_view = memoryview(bundle)
+        # offset, size, command and the send time of chunks that carried the lock
+        pending: deque[tuple[int, int, PendingCommand, Optional[float]]] = deque()
+
+        async def collect():
+            offset, size, command, locked_at = pending.popleft()
+            try:
+                result = await asyncio.wait_for(command.future, timeout=self.lock_timeout)
+            except BaseException:
+                self.abandon_command(command)
+                raise
+            finally:
+                self.in_flight.release()
+            if locked_at is not None:
+                self.renew_lease(locked_at)
+            result = result[:size]
+            miso[offset:offset + len(result)] = result
+
+        started_at = time.perf_counter()
+        async with self.exclusive(), self.miso_lock:
+            try:
+                for offset in range(0, len(mosi), chunk_size):
+                    chunk = mosi[offset:offset + chunk_size]
+                    size = len(chunk)
+                    # power and CS are set once for the whole frame
+                    frame_start = {} if offset else {
+                        'power': True, 'power_wait': self.power_wait, 'cs': self.cs, 'cs_wait': self.cs_wait,
+                    }
+                    end = self.pack_data_bundle_into(
+                        bundle, **self.bundle_lock(1), **frame_start, command=2, size_write=size, mosi=chunk,
+                    )
+
+                    if not self.result_carries_miso:
+                        await asyncio.wait_for(self.set_bundle(bundle_view[:end]), timeout=self.lock_timeout)
+                        result = (await self.read_miso())[:size]
+                        miso[offset:offset + len(result)] = result
+                        continue
+
+                    if len(pending) >= self.max_in_flight:
+                        await collect()
+
+                    await self.in_flight.acquire()
+                    command = self.register_command(ID_MAP[DATA_BUNDLE_UUID])
+                    locked_at = time.monotonic() if bundle[0] & LOCK_SET else None
+                    try:
+                        await self.client.write_gatt_char(characteristic, bundle_view[:end], response=False)
+                    except BaseException:
+                        self.discard_command(command)
+                        self.in_flight.release()
+                        raise
+                    self.count_round_trip()
+                    pending.append((offset, size, command, locked_at))
+
+                while pending:
+                    await collect()
+            finally:
+                for _, _, command, _ in pending:
+                    self.abandon_command(command)
+                    self.in_flight.release()
+
+        elapsed = time.perf_counter() - started_at
+        throughput = len(mosi) / elapsed if elapsed > 0 else 0.0
+        STREAM_THROUGHPUT.observe(throughput)
+        logger.info(f'Streamed {len(mosi)} bytes in {elapsed:.4f} secs ({throughput:.0f} B/s, {chunk_size} B chunks)')
+        return miso
 
     @log_runtime_async
     async def scan_i2c(self):
-        bundle = self.pack_data_bundle(
-            lock=2, power=True, command=3, address=0, size_write=0, mosi=bytearray(),
-            power_wait=self.power_wait
-        )
-        await self.set_bundle(bundle)
-        return [address for address in await self.read_miso() if address != 0]
+        @with_timeout(self.lock_timeout)
+        async def f():
+            bundle = self.pack_data_bundle(
+                **self.bundle_lock(2), power=True, command=3, address=0, size_write=0, mosi=bytearray(),
+                power_wait=self.power_wait
+            )
+            return [address for address in await self.set_bundle_read_miso(bundle) if address != 0]
 
-    @log_runtime
-    def write(self, address: int, buf: bytearray):
+        async with self.exclusive():
+            return await f()
+
+    @log_runtime_async
+    async def write(self, address: int, buf: bytearray):
         @with_timeout(self.lock_timeout)
         async def f():
             bundle = self.pack_data_bundle(
-                lock=2, power=True, command=0, address=address, size_write=len(buf), mosi=buf,
+                **self.bundle_lock(2), power=True, command=0, address=address, size_write=len(buf), mosi=buf,
                 power_wait=self.power_wait
             )
             await self.set_bundle(bundle)
 
-        loop = asyncio.get_running_loop()
-        task = loop.create_task(f())
-
-        return loop.run_until_complete(task)
+        async with self.exclusive():
+            return await f()
 
-    @log_runtime
-    def read(self, address: int, size: int):
+    @log_runtime_async
+    async def read(self, address: int, size: int):
         @with_timeout(self.lock_timeout)
         async def f():
             bundle = self.pack_data_bundle(
-                lock=2, power=True, command=1, address=address, size_read=size
+                **self.bundle_lock(2), power=True, command=1, address=address, size_read=size
             )
-            await self.set_bundle(bundle)
-            result = await self.read_miso()
+            result = await self.set_bundle_read_miso(bundle)
             return result[:size]
 
-        loop = asyncio.get_running_loop()
-        task = loop.create_task(f())
-
-        return loop.run_until_complete(task)
+        async with self.exclusive():
+            return await f()
 
-    @log_runtime
-    def write_read(self, address: int, buf: bytearray, size_read: int):
+    @log_runtime_async
+    async def write_read(self, address: int, buf: bytearray, size_read: int, delay: int = 0):
         @with_timeout(self.lock_timeout)
         async def f():
             bundle = self.pack_data_bundle(
-                lock=2, power=True, command=2, address=address, size_write=len(buf), size_read=size_read, mosi=buf)
-            await self.set_bundle(bundle)
-            return await self.read_miso()
+                **self.bundle_lock(2), power=True, command=2, address=address, size_write=len(buf), size_read=size_read,
+                mosi=buf, transfer_delay=delay,
+            )
+            return await self.set_bundle_read_miso(bundle)
 
-        loop = asyncio.get_running_loop()
-        task = loop.create_task(f())
+        async with self.exclusive():
+            return await f()
 
-        return loop.run_until_complete(task)
+    async def i2c_rdwr(self, *messages):
+        """
+        Run the messages as one transaction. A write followed by a read from the same address is packed into
+        a single transfer bundle. A delay in between, like the 1 ms of every SCD4X command, only packs with
+        inline_transfer_delay; with baseline firmware such a pair still costs a write, the delay and a read.
+        """
+        round_trips = RoundTrips()
+        token = CURRENT_ROUND_TRIPS.set(round_trips)
+        try:
+            await self._run_messages(messages)
+        finally:
+            CURRENT_ROUND_TRIPS.reset(token)
+        TRANSACTION_ROUND_TRIPS.observe(round_trips.count)
 
-    def i2c_rdwr(self, *messages):
-        for message in messages:
+    async def _run_messages(self, messages):
+        index = 0
+        while index < len(messages):
+            message = messages[index]
             match message:
                 case WriteMessage(address, buf):
-                    self.write(address, buf)
+                    read_index, delay = index + 1, 0
+                    if read_index < len(messages) and isinstance(messages[read_index], DelayMessage):
+                        delay = messages[read_index].ms
+                        read_index += 1
+
+                    read = messages[read_index] if read_index < len(messages) else None
+                    if (
+                            isinstance(read, ReadMessage) and read.address == address
+                            and (delay == 0 or (self.inline_transfer_delay and delay <= 0xFF))
+                    ):
+                        read.buf = (await self.write_read(address, buf, read.size, delay=delay))[:read.size]
+                        logger.info("Wrote {} and read {} bytes at address {}: {}", len(buf), read.size, address,
+                                    read.buf)
+                        index = read_index + 1
+                        continue
+
+                    await self.write(address, buf)
                     logger.info("Wrote {} bytes to address {}", len(buf), address)
+                case DelayMessage(ms=ms):
+                    await asyncio.sleep(ms / 1000.0)
                 case ReadMessage(address=address, size=size):
-                    result = self.read(address, size)
+                    result = await self.read(address, size)
                     message.buf = result
                     logger.info("Read {} bytes from address {}: {}", size, address, result)
+            index += 1
 
 
 def with_timeout(timeout: float):
@@ -398,6 +798,11 @@ class ReadMessage:
         return iter(self.buf)
 
 
+@dataclass
+class DelayMessage:
+    ms: int
+
+
 class I2cMessage:
     @staticmethod
     def write(address: int, buf: bytearray):
@@ -407,5 +812,9 @@ class I2cMessage:
     def read(address: int, size: int):
         return ReadMessage(address, size)
 
+    @staticmethod
+    def delay(ms: int):
+        return DelayMessage(ms)
+
 
 i2c_msg = I2cMessage()
@@ -1,6 +1,5 @@
 from dataclasses import dataclass
 
-from conv import deserialize_int, deserialize_float
 from characteristic.notifiable_characteristic import NotifiableCharacteristic
 from service.abstract_service import AbstractService
 from service.state import ServiceState
@@ -22,19 +21,19 @@ class LIS2DH12Service(AbstractService):
     def init_state(self):
         self.state = LIS2DH12State(
             x=self.gauge(
-                uuid='eaeaeaea-0000-0000-0000-00805f9b34fb', deserialize_fn=deserialize_float,
+                uuid='eaeaeaea-0000-0000-0000-00805f9b34fb', codec='float',
                 metric_name='x', documentation='X acceleration', unit='ms2',
             ),
             y=self.gauge(
-                uuid='eaeaeaea-0000-1000-0000-00805f9b34fb', deserialize_fn=deserialize_float,
+                uuid='eaeaeaea-0000-1000-0000-00805f9b34fb', codec='float',
                 metric_name='y', documentation='Y acceleration', unit='ms2',
             ),
             z=self.gauge(
-                uuid='eaeaeaea-0000-2000-0000-00805f9b34fb', deserialize_fn=deserialize_float,
+                uuid='eaeaeaea-0000-2000-0000-00805f9b34fb', codec='float',
                 metric_name='z', documentation='Z acceleration', unit='ms2',
             ),
             timeout=self.gauge(
-                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', codec='int',
                 metric_name='timeout', documentation='Timeout', unit='count',
             ),
         )
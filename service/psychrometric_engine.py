@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import weakref
+
+import numpy as np
+from loguru import logger
+from pythermalcomfort.psychrometrics import psy_ta_rh
+
+from service.bme_280 import Bme280Service, psychrometric_values_as_dict
+
+DERIVED_KEYS = {
+    'p_sat': 'p_sat',
+    'p_vap': 'p_vap',
+    'hr': 'hr',
+    't_wb': 't_wb',
+    't_dp': 't_dp',
+    'enthalpy': 'h',
+}
+
+
+class PsychrometricEngine:
+    """
+    Evaluates BME280 psychrometrics for the whole fleet in one vectorized psy_ta_rh call.
+
+    Enable it with ``Bme280Service.psychrometric_engine = engine`` before any device connects;
+    services then register themselves and stop solving inside their notification callbacks.
+    Drive it either with ``run(interval)`` or by registering the engine in a prometheus
+    registry, which refreshes the derived gauges lazily on every scrape.
+    """
+
+    def __init__(self):
+        self._services: weakref.WeakSet[Bme280Service] = weakref.WeakSet()
+        self._last_inputs: weakref.WeakKeyDictionary[Bme280Service, tuple] = weakref.WeakKeyDictionary()
+        # services register from the event loop while a scrape refreshes from its own thread
+        self._lock = threading.Lock()
+
+    def register(self, service: Bme280Service):
+        with self._lock:
+            self._services.add(service)
+
+    def unregister(self, service: Bme280Service):
+        with self._lock:
+            self._services.discard(service)
+            self._last_inputs.pop(service, None)
+
+    def _collect_changed(self):
+        services = []
+        inputs = []
+        with self._lock:
+            candidates = [(service, self._last_inputs.get(service)) for service in self._services]
+
+        for service, last_inputs in candidates:
+            state = service.state
+            triple = (state.temperature.value, state.humidity.value, state.pressure.value)
+            if None in triple or last_inputs == triple:
+                continue
+            services.append(service)
+            inputs.append(triple)
+
+        return services, inputs
+
+    @logger.catch
+    def refresh(self) -> int:
+        """Recompute the derived gauges of every service whose inputs changed; returns the batch size"""
+        services, inputs = self._collect_changed()
+        if not services:
+            return 0
+
+        columns = np.asarray(inputs, dtype=np.float64)
+        values = psychrometric_values_as_dict(psy_ta_rh(tdb=columns[:, 0], rh=columns[:, 1], p_atm=columns[:, 2]))
+        values = {key: np.asarray(value, dtype=np.float64) for key, value in values.items()}
+
+        # written under the lock: a service unregisters before resetting its series, so one that went away
+        # while the batch was solved is skipped instead of having its series recreated
+        with self._lock:
+            for row, (service, triple) in enumerate(zip(services, inputs)):
+                if service not in self._services:
+                    continue
+                state = service.state
+                for name, key in DERIVED_KEYS.items():
+                    getattr(state, name).set_value(float(values[key][row]))
+                self._last_inputs[service] = triple
+
+        return len(services)
+
+    async def run(self, interval: float = 5.0):
+        while True:
+            self.refresh()
+            await asyncio.sleep(interval)
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        # refresh() logs its own failures, so a bad batch never fails the scrape
+        self.refresh()
+        return []
@@ -4,8 +4,7 @@ from dataclasses import dataclass
 from loguru import logger
 
 from characteristic.notifiable_characteristic import NotifiableCharacteristic
-from contrib.scd import SCD4X
-from conv import deserialize_noop
+from contrib.scd import SCD4X, DEFAULT_I2C_ADDRESS
 from service.abstract_service import AbstractService
 from service.expander import ExpanderService
 from service.state import ServiceState
@@ -22,49 +21,93 @@ class ScdService(AbstractService):
     namespace = 'sensor_hub'
     subsystem = 'scd41'
     state: ScdState
+    # low power periodic mode samples every 30 s instead of every 5 s
+    low_power: bool = False
+    measurement_interval: float = 60.0
+    data_ready_poll_interval: float = 1.0
 
-    def __init__(self, expander_service: ExpanderService, registry, labels):
+    def __init__(self, expander_service: ExpanderService, registry, labels, periodic_sessions: set[int] | None = None):
         self.expander_service = expander_service
         self.registry = registry
         self.labels = labels
         self.label_names = [*self.labels.keys()]
         self.registry = registry
+        self.scd: SCD4X | None = None
+        # i2c addresses of the device whose sensor was left in periodic measurement, see ServiceManager
+        self.periodic_sessions = periodic_sessions if periodic_sessions is not None else set()
+        # the session was left running by an earlier connection rather than started by this one
+        self.resumed = False
         self.init_state()
 
+    async def start_session(self) -> SCD4X:
+        """Start periodic measurement once; the sensor keeps sampling on its own between reads and connections"""
+        self.resumed = DEFAULT_I2C_ADDRESS in self.periodic_sessions
+        if self.resumed:
+            # the constructor does no I/O
+            return SCD4X(self.expander_service, quiet=False)
+
+        scd = await SCD4X.create(self.expander_service, quiet=False)
+        await scd.start_periodic_measurement(low_power=self.low_power)
+        self.periodic_sessions.add(DEFAULT_I2C_ADDRESS)
+        return scd
+
     async def subscribe(self):
-        def run_measurements():
-            scd = SCD4X(self.expander_service, quiet=False)
-            scd.start_periodic_measurement()
-            co2, temperature, relative_humidity, _ = scd.measure(timeout=15)
+        sampling_period = 30 if self.low_power else 5
+        # a few sampling periods of the selected mode
+        measure_timeout = 3 * sampling_period
+
+        async def run_measurements():
+            if self.scd is None:
+                self.scd = await self.start_session()
+
+            try:
+                co2, temperature, relative_humidity, _ = await self.scd.measure(
+                    timeout=2 * sampling_period if self.resumed else measure_timeout,
+                    poll_interval=self.data_ready_poll_interval,
+                )
+            except RuntimeError:
+                if not self.resumed:
+                    raise
+                # the hub lost power since the session was started
+                logger.warning(f'SCD41 of {self.labels.get("device")} is not measuring, restarting it')
+                self.periodic_sessions.discard(DEFAULT_I2C_ADDRESS)
+                self.scd = await self.start_session()
+                co2, temperature, relative_humidity, _ = await self.scd.measure(
+                    timeout=measure_timeout, poll_interval=self.data_ready_poll_interval
+                )
             self.state.co2.update_value(co2)
             self.state.temperature.update_value(temperature)
             self.state.humidity.update_value(relative_humidity)
+            self.state.sampled()
 
         async def f():
-            while True:
+            while self.expander_service.client.is_connected:
                 try:
-                    run_measurements()
+                    # one lock lease per cycle instead of a lock per bundle and an explicit unlock
+                    async with self.expander_service.session(lease_ms=(measure_timeout + 5) * 1000):
+                        await run_measurements()
                 except Exception as e:
                     logger.error('Failed to read %s: {}' % type(e), e, exc_info=True)
-                finally:
-                    await self.expander_service.set_lock(False)
+                    # re-initialise the sensor on the next cycle
+                    self.scd = None
+                    self.periodic_sessions.discard(DEFAULT_I2C_ADDRESS)
 
-                await asyncio.sleep(60)
+                await asyncio.sleep(self.measurement_interval)
 
         asyncio.create_task(f())
 
     def init_state(self):
         self.state = ScdState(
             co2=self.gauge(
-                uuid='00000000-0000-0000-0000-000000000000', deserialize_fn=deserialize_noop,
+                uuid='00000000-0000-0000-0000-000000000000', codec='noop',
                 metric_name='co2', documentation='CO2', unit='ppm',
             ),
             temperature=self.gauge(
-                uuid='00000000-0000-0000-0000-000000000000', deserialize_fn=deserialize_noop,
+                uuid='00000000-0000-0000-0000-000000000000', codec='noop',
                 metric_name='temperature', documentation='Temperature', unit='degrees_celsius',
             ),
             humidity=self.gauge(
-                uuid='00000000-0000-0000-0000-000000000000', deserialize_fn=deserialize_noop,
+                uuid='00000000-0000-0000-0000-000000000000', codec='noop',
                 metric_name='humidity', documentation='Humidity', unit='percent',
             ),
         )
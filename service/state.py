@@ -1,30 +1,185 @@
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Optional, Callable, TYPE_CHECKING
+
 from bleak import BleakGATTCharacteristic
 from loguru import logger
 
 from characteristic.notifiable_characteristic import NotifiableCharacteristic, DerivedMetric
 
+if TYPE_CHECKING:
+    from ingest import IngestQueue
+
+
+@dataclass(frozen=True)
+class DispatchEntry:
+    name: str
+    characteristic: NotifiableCharacteristic
+    derived: tuple[DerivedMetric, ...]
+
 
 class ServiceState:
+    # seconds to collect notifications arriving close together before running derived metrics
+    # and post_process once for the whole batch; 0 processes every notification immediately
+    coalesce_window: float = 0.0
+    # when set, notifications only mark derived metrics dirty and the collector computes them on scrape
+    derived_metrics_collector: Optional['DerivedMetricsCollector'] = None
+    # one-shot hook fired by the first notification handled by this state
+    on_first_sample: Optional[Callable[[], None]] = None
+    # labeled prometheus counter child incremented on every notification, e.g. per adapter
+    notification_counter = None
+    # when set, notification callbacks only enqueue the raw value and the queue consumers apply it
+    ingest_queue: Optional['IngestQueue'] = None
+
+    def __post_init__(self):
+        self.build_dispatch_table()
+        self._pending: dict[str, DispatchEntry] = {}
+        self._pending_flush: asyncio.TimerHandle | None = None
+        self._dirty_derived: dict[int, tuple[DerivedMetric, NotifiableCharacteristic]] = {}
+        # the collector refreshes from the scrape thread while the event loop marks metrics dirty
+        self._dirty_lock = threading.Lock()
+
+        if self.derived_metrics_collector is not None and self._derived_metrics:
+            self.derived_metrics_collector.register(self)
+
+    def build_dispatch_table(self):
+        """
+        Index characteristics by normalized UUID together with the derived metrics they trigger.
+        Called once when the state is built; call it again if the state fields are replaced.
+        """
+        characteristics = []
+        derived_metrics = []
+        for name, value in self.__dict__.items():
+            if isinstance(value, NotifiableCharacteristic):
+                characteristics.append((name, value))
+            elif isinstance(value, DerivedMetric):
+                derived_metrics.append(value)
+
+        dispatch_by_name = {}
+        dispatch_by_uuid = {}
+        for name, nch in characteristics:
+            derived = tuple(derived for derived in derived_metrics if name in derived.triggered_by)
+            entry = DispatchEntry(name, nch, derived)
+            dispatch_by_name[name] = entry
+            # keep the first declared characteristic for a duplicated UUID
+            dispatch_by_uuid.setdefault(nch.uuid.lower(), entry)
+
+        self._characteristics = tuple(nch for _, nch in characteristics)
+        self._derived_metrics = tuple(derived_metrics)
+        self._dispatch_by_name: dict[str, DispatchEntry] = dispatch_by_name
+        self._dispatch_by_uuid: dict[str, DispatchEntry] = dispatch_by_uuid
+        # filled lazily: bleak handles are only known once notifications start coming in
+        self._dispatch_by_handle: dict[int, DispatchEntry] = {}
+
+    def _find_dispatch_entry(self, characteristic: BleakGATTCharacteristic):
+        entry = self._dispatch_by_handle.get(characteristic.handle)
+        if entry is not None:
+            return entry
+
+        entry = self._dispatch_by_uuid.get(characteristic.uuid.lower())
+        if entry is not None:
+            self._dispatch_by_handle[characteristic.handle] = entry
+        return entry
+
+    def handle_notification(self, characteristic: BleakGATTCharacteristic, data: bytearray):
+        """bleak notification callback"""
+        if self.ingest_queue is None:
+            self.update_characteristic(characteristic, data)
+            return
+
+        self.ingest_queue.put(self.update_characteristic, characteristic, data)
+
     @logger.catch
     def update_characteristic(self, characteristic: BleakGATTCharacteristic, data: bytearray):
-        nch_name, nch = self._find_notifiable_characteristic(characteristic.uuid)
-        if nch is None:
+        entry = self._find_dispatch_entry(characteristic)
+        if entry is None:
             logger.warning(f'Unknown characteristic {characteristic.uuid}; value: {data}')
             return
 
+        if self.notification_counter is not None:
+            self.notification_counter.inc()
+
+        if self.on_first_sample is not None:
+            self.sampled()
+
+        nch = entry.characteristic
         nch.update_value(data)
-        self.update_derived_metrics(nch_name, nch)
-        self.post_process(nch_name, nch)
 
-    def _find_notifiable_characteristic(self, uuid: str):
-        for name, value in self.__dict__.items():
-            if not isinstance(value, NotifiableCharacteristic):
-                continue
+        if self.coalesce_window > 0 and self._schedule_flush(entry):
+            return
+
+        self._update_derived(entry.derived, nch)
+        self.post_process(entry.name, nch)
+
+    def sampled(self):
+        """Fire on_first_sample; states updated outside update_characteristic call it themselves"""
+        if self.on_first_sample is not None:
+            on_first_sample, self.on_first_sample = self.on_first_sample, None
+            on_first_sample()
+
+    def _update_derived(self, derived_metrics, notifiable_characteristic: NotifiableCharacteristic):
+        if self.derived_metrics_collector is None:
+            for derived in derived_metrics:
+                derived.update_value(self, notifiable_characteristic)
+            return
+
+        with self._dirty_lock:
+            for derived in derived_metrics:
+                self._dirty_derived[id(derived)] = derived, notifiable_characteristic
+
+    def refresh_derived_metrics(self):
+        """
+        Compute the derived metrics marked dirty since the last refresh.
+        Runs under the dirty lock, so a concurrent reset_metrics either finds the series written or none left
+        to write; the derived series are only touched while holding it.
+        """
+        with self._dirty_lock:
+            dirty, self._dirty_derived = self._dirty_derived, {}
+            for derived, notifiable_characteristic in dirty.values():
+                derived.update_value(self, notifiable_characteristic)
+
+    def _schedule_flush(self, entry: DispatchEntry) -> bool:
+        if self._pending_flush is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return False
+            self._pending_flush = loop.call_later(self.coalesce_window, self.flush_pending)
+
+        # re-insert so the batch keeps the arrival order of its latest notifications
+        self._pending.pop(entry.name, None)
+        self._pending[entry.name] = entry
+        return True
+
+    @logger.catch
+    def flush_pending(self):
+        if self._pending_flush is not None:
+            self._pending_flush.cancel()
+            self._pending_flush = None
 
-            if value.uuid.lower() == uuid.lower():
-                return name, value
+        if not self._pending:
+            return
+
+        entries = list(self._pending.values())
+        self._pending.clear()
+        last = entries[-1]
+
+        derived_metrics = {}
+        for entry in entries:
+            for derived in entry.derived:
+                derived_metrics[id(derived)] = derived
+
+        self._update_derived(derived_metrics.values(), last.characteristic)
+        self.post_process(last.name, last.characteristic)
+
+    def _find_notifiable_characteristic(self, uuid: str):
+        entry = self._dispatch_by_uuid.get(uuid.lower())
+        if entry is None:
+            return None, None
 
-        return None, None
+        return entry.name, entry.characteristic
 
     @property
     def display_name(self):
@@ -39,21 +194,61 @@ class ServiceState:
         return f'{self_name}({", ".join(parts)})'
 
     def update_derived_metrics(self, nch_name: str, notifiable_characteristic: NotifiableCharacteristic):
-        for name, derived in self.__dict__.items():
-            if not isinstance(derived, DerivedMetric):
-                continue
-
-            if nch_name not in derived.triggered_by:
-                continue
+        entry = self._dispatch_by_name.get(nch_name)
+        if entry is None:
+            return
 
-            derived.update_value(self, notifiable_characteristic)
+        self._update_derived(entry.derived, notifiable_characteristic)
 
     def post_process(self, nch_name: str, notifiable_characteristic: NotifiableCharacteristic):
         pass
 
     def reset_metrics(self):
-        for name, value in self.__dict__.items():
-            if isinstance(value, NotifiableCharacteristic):
-                value.reset()
-            elif isinstance(value, DerivedMetric):
+        if self._pending_flush is not None:
+            self._pending_flush.cancel()
+            self._pending_flush = None
+        self._pending.clear()
+        if self.ingest_queue is not None:
+            # applying them later would recreate the series of a device that is gone
+            self.ingest_queue.purge(self)
+        for value in self._characteristics:
+            value.reset()
+        # a scrape refreshing this state either finishes first or finds nothing dirty
+        with self._dirty_lock:
+            self._dirty_derived.clear()
+            for value in self._derived_metrics:
                 value.reset()
+
+
+class DerivedMetricsCollector:
+    """
+    Prometheus collector that computes dirty derived metrics right before a scrape.
+    Register it before any service gauge so the refreshed values are the ones collected.
+    """
+
+    def __init__(self):
+        # keyed by id: dataclass states define __eq__ and are therefore unhashable
+        self._states: weakref.WeakValueDictionary[int, ServiceState] = weakref.WeakValueDictionary()
+        # states register from the event loop while refresh runs in the scrape thread
+        self._lock = threading.Lock()
+
+    def register(self, state: ServiceState):
+        with self._lock:
+            self._states[id(state)] = state
+
+    def refresh(self):
+        with self._lock:
+            states = list(self._states.values())
+        for state in states:
+            state.refresh_derived_metrics()
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        # a failing derived metric must not fail the whole scrape
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.exception('Failed to refresh derived metrics: {}', e)
+        return []
@@ -1,6 +1,5 @@
 from dataclasses import dataclass
 
-from conv import deserialize_int
 from characteristic.notifiable_characteristic import NotifiableCharacteristic, DerivedMetric
 from service.abstract_service import AbstractService
 from service.state import ServiceState
@@ -34,32 +33,32 @@ class VEML6040Service(AbstractService):
 
         self.state = VEML6040State(
             red=self.gauge(
-                uuid='ebbbbaea-a000-0000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='ebbbbaea-a000-0000-0000-00805f9b34fb', codec='int',
                 metric_name='red', documentation='red', unit='raw',
             ),
             green=self.gauge(
-                uuid='eaeaeaea-b000-1000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='eaeaeaea-b000-1000-0000-00805f9b34fb', codec='int',
                 metric_name='green', documentation='green', unit='raw',
             ),
             blue=self.gauge(
-                uuid='eaeaeaea-c000-2000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='eaeaeaea-c000-2000-0000-00805f9b34fb', codec='int',
                 metric_name='blue', documentation='blue', unit='raw',
             ),
             white=self.gauge(
-                uuid='eaeaeaea-d000-3000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='eaeaeaea-d000-3000-0000-00805f9b34fb', codec='int',
                 metric_name='white', documentation='white', unit='raw',
             ),
             cct=self.gauge(
-                uuid='2AE9', deserialize_fn=deserialize_int,
+                uuid='2AE9', codec='int',
                 metric_name='cct', documentation='Correlated Color Temperature', unit='kelvin',
                 post_process_fn=post_process_cct
             ),
             lux=self.gauge(
-                uuid='2AFF', deserialize_fn=deserialize_int,
+                uuid='2AFF', codec='int',
                 metric_name='lux', documentation='Luminous Flux', unit='lumen',
             ),
             timeout=self.gauge(
-                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', deserialize_fn=deserialize_int,
+                uuid='a0e4a2ba-0000-8000-0000-00805f9b34fb', codec='int',
                 metric_name='timeout', documentation='Timeout', unit='count',
             ),
         )
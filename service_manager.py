@@ -1,9 +1,14 @@
+import asyncio
+import time
 from asyncio import sleep
+from functools import partial
+from typing import Optional, Callable
 
 from bleak import BleakClient
-from prometheus_client import REGISTRY
+from prometheus_client import REGISTRY, Histogram
 from loguru import logger
 
+from adapters import ADAPTER_NOTIFICATIONS
 from service.abstract_service import AbstractService
 from service.lis2dh12 import LIS2DH12Service
 from service.adc import AdcService
@@ -13,6 +18,12 @@ from service.expander import ExpanderService
 from service.scd_service import ScdService
 from service.veml6040 import VEML6040Service
 
+DEVICE_SETUP_TIME = Histogram(
+    name='device_setup', documentation='Time to connect to a device and subscribe to all of its characteristics',
+    unit='seconds', namespace='sensor_hub', subsystem='collector',
+    buckets=(0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, float('inf')),
+)
+
 
 class ServiceManager:
     SERVICE_CLASS_MAP = {
@@ -28,11 +39,38 @@ class ServiceManager:
         0x62: ScdService
     }
 
-    def __init__(self, address: str, labels: dict[str, str]):
+    # called as client_factory(address, **kwargs); replaced by fakes to run without a radio
+    client_factory = BleakClient
+
+    def __init__(
+            self,
+            address: str,
+            labels: dict[str, str],
+            max_gatt_operations: int = 4,
+            adapter: Optional[str] = None,
+            coalesce_windows: Optional[dict[type[AbstractService], float]] = None,
+            periodic_sessions: Optional[set[int]] = None,
+    ):
         self.address = address
         self.labels = labels
-        self.client = BleakClient(self.address)
+        # upper bound on start_notify calls in flight for this device
+        self.max_gatt_operations = max_gatt_operations
+        self.adapter = adapter
+        # ServiceState.coalesce_window per service class, for the states this manager builds
+        self.coalesce_windows = coalesce_windows or {}
+        # i2c addresses whose sensor keeps measuring on its own between connections; the scheduler passes the set
+        # of its device record so that the next round resumes, any other connection starts from an idle sensor
+        self.periodic_sessions = periodic_sessions if periodic_sessions is not None else set()
+        if adapter is not None:
+            self.client = self.client_factory(self.address, adapter=adapter)
+        else:
+            self.client = self.client_factory(self.address)
         self.services: list[AbstractService] = []
+        self.on_first_sample: Optional[Callable[[], None]] = None
+        self.first_sample_at: Optional[float] = None
+        # services that still have to deliver their first notification; the round completes when empty
+        self._awaiting_sample: set[int] = set()
+        self.round_complete = asyncio.Event()
 
     def get_expander(self) -> ExpanderService | None:
         for service in self.services:
@@ -41,11 +79,33 @@ class ServiceManager:
 
         return None
 
+    def _first_sample(self, service: AbstractService):
+        self._awaiting_sample.discard(id(service))
+        if not self._awaiting_sample:
+            self.round_complete.set()
+
+        if self.first_sample_at is not None:
+            return
+
+        self.first_sample_at = time.monotonic()
+        if self.on_first_sample is not None:
+            self.on_first_sample()
+
+    async def wait_round(self, timeout: float) -> bool:
+        """Wait until every notifying service delivered a sample; False if some did not within the timeout"""
+        try:
+            await asyncio.wait_for(self.round_complete.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
     async def subscribe_all(self):
+        started_at = time.monotonic()
         logger.info(f'Connecting to {self.address}')
         await self.client.connect()
         logger.info(f'Connected to {self.address}')
 
+        services = []
         for svc in self.client.services:
             service_class = self.SERVICE_CLASS_MAP.get(svc.uuid.lower())
             if service_class is None:
@@ -53,10 +113,25 @@ class ServiceManager:
                 continue
 
             service = service_class(self.client, svc, REGISTRY, labels=self.labels)
-            await service.subscribe()
+            service.state.on_first_sample = partial(self._first_sample, service)
+            coalesce_window = self.coalesce_windows.get(service_class)
+            if coalesce_window is not None:
+                service.state.coalesce_window = coalesce_window
+            if self.adapter is not None:
+                service.state.notification_counter = ADAPTER_NOTIFICATIONS.labels(adapter=self.adapter)
+            if service.state._characteristics:
+                self._awaiting_sample.add(id(service))
+            services.append(service)
+
+        semaphore = asyncio.Semaphore(self.max_gatt_operations)
+        failures = await asyncio.gather(*(service.subscribe(semaphore) for service in services))
+        for service, service_failures in zip(services, failures):
+            if service_failures:
+                logger.warning(f'{service.display_name}: {len(service_failures)} characteristics failed to subscribe')
             logger.info(f'Subscribed to {service.display_name}')
             self.services.append(service)
 
+        for service in services:
             if isinstance(service, Bme280Service) and self.address == 'D0:C4:28:22:81:9D':
                 await service.set_calibration(16.0, 0.0, 0.0)
 
@@ -74,12 +149,11 @@ class ServiceManager:
 
             if isinstance(service, ExpanderService):
                 try:
-                    i2c_addresses = await service.scan_i2c()
+                    async with service.session():
+                        i2c_addresses = await service.scan_i2c()
                 except Exception as e:
                     logger.error(f'Failed to scan i2c: {e}')
                     continue
-                finally:
-                    await service.set_lock(False)
 
                 # i2c_addresses = [0x62]
 
@@ -89,9 +163,19 @@ class ServiceManager:
                     if i2c_service_class is None:
                         logger.warning(f'No i2c service class for 0x{address:02x}')
                         continue
-                    i2c_svc = i2c_service_class(service, REGISTRY, labels=self.labels)
+                    i2c_svc = i2c_service_class(
+                        service, REGISTRY, labels=self.labels, periodic_sessions=self.periodic_sessions
+                    )
+                    # a scheduled round only completes once the i2c sensors delivered a reading as well
+                    i2c_svc.state.on_first_sample = partial(self._first_sample, i2c_svc)
+                    self._awaiting_sample.add(id(i2c_svc))
+                    self.round_complete.clear()
                     await i2c_svc.subscribe()
 
+        setup_time = time.monotonic() - started_at
+        DEVICE_SETUP_TIME.observe(setup_time)
+        logger.info(f'Set up {self.address} in {setup_time:.2f} secs')
+
     async def block(self):
         while self.client.is_connected:
             for service in self.services:
@@ -99,6 +183,12 @@ class ServiceManager:
             await sleep(10)
         logger.error(f'Disconnected from {self.address}')
 
+    async def disconnect(self):
+        try:
+            await self.client.disconnect()
+        except Exception as e:
+            logger.error(f'Failed to disconnect from {self.address}: {e}')
+
     def reset_service_metrics(self):
         for service in self.services:
             service.reset_state_metrics()
@@ -0,0 +1,169 @@
+import asyncio
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from bench.fakes import FakeClient, fake_service
+from service import expander
+from service.expander import ExpanderService, ExpanderError, ID_MAP, LOCK_UUID, POWER_UUID, CS_UUID, DATA_BUNDLE_UUID
+
+CHARACTERISTICS = [
+    expander.DATA_BUNDLE_UUID, expander.MISO_UUID, expander.CS_UUID, expander.LOCK_UUID, expander.POWER_UUID,
+    expander.RESULT_UUID,
+]
+
+
+class ScriptedClient(FakeClient):
+    """Answers nothing on its own: the test decides which result notifications arrive and when"""
+
+    def __init__(self):
+        super().__init__([fake_service('expander', CHARACTERISTICS)])
+        self.writes: list[tuple[str, bytes]] = []
+        self.miso = bytearray()
+
+        # answer every write with its success result, as the firmware would
+        self.auto_result = False
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        self.writes.append((characteristic.uuid, bytes(data)))
+        if self.auto_result:
+            asyncio.get_running_loop().call_soon(self.result, bytes([ID_MAP[characteristic.uuid]]))
+
+    async def read_gatt_char(self, characteristic, response=False):
+        return self.miso
+
+    def result(self, data: bytes):
+        handle = self.services[0].get_characteristic(expander.RESULT_UUID).handle
+        self.notify(handle, bytearray(data))
+
+
+class ExpanderResultTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = ScriptedClient()
+        self.expander = ExpanderService(self.client, self.client.services[0], CollectorRegistry())
+        self.expander.lock_timeout = 0.05
+        await self.expander.subscribe()
+
+    async def written(self, count: int):
+        while len(self.client.writes) < count:
+            await asyncio.sleep(0)
+
+    async def test_results_match_commands_in_order(self):
+        first = asyncio.create_task(self.expander.set_cs(1))
+        second = asyncio.create_task(self.expander.set_cs(2))
+        await self.written(2)
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        await asyncio.gather(first, second)
+
+    async def test_late_result_is_dropped(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.expander.set_cs(1)
+
+        # the result of the timed-out command arrives after all, then the one of the next command
+        task = asyncio.create_task(self.expander.set_cs(2))
+        await self.written(2)
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        await asyncio.sleep(0.01)
+        self.assertFalse(task.done())
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        await task
+
+    async def test_lost_result_expires(self):
+        self.expander.late_result_window = 0.0
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.expander.set_cs(1)
+
+        task = asyncio.create_task(self.expander.set_cs(2))
+        await self.written(2)
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        await task
+
+    async def test_lost_result_costs_one_more_command(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.expander.set_cs(1)
+
+        # taken for the late result of the first command
+        task = asyncio.create_task(self.expander.set_cs(2))
+        await self.written(2)
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        with self.assertRaises(asyncio.TimeoutError):
+            await task
+
+        # the second command leaves no tombstone behind, so the third one gets its result
+        task = asyncio.create_task(self.expander.set_cs(3))
+        await self.written(3)
+        self.client.result(bytes([ID_MAP[CS_UUID]]))
+        await task
+        self.assertFalse(self.expander.pending[ID_MAP[CS_UUID]])
+
+    async def test_lock_error_fails_the_lock_command(self):
+        power = asyncio.create_task(self.expander.set_power(True))
+        lock = asyncio.create_task(self.expander.set_lock(2))
+        await self.written(2)
+        self.client.result((-4).to_bytes(1, 'little', signed=True))
+        with self.assertRaises(ExpanderError):
+            await lock
+        await asyncio.sleep(0.01)
+        self.assertFalse(power.done())
+        self.client.result(bytes([ID_MAP[POWER_UUID]]))
+        await power
+
+    async def test_field_error_fails_the_data_bundle(self):
+        lock = asyncio.create_task(self.expander.set_lock(2))
+        write = asyncio.create_task(self.expander.write(0x62, bytearray(b'\x01')))
+        await self.written(2)
+        # SIZE error of the bundle
+        self.client.result((-7).to_bytes(1, 'little', signed=True))
+        with self.assertRaises(ExpanderError):
+            await write
+        self.client.result(bytes([ID_MAP[LOCK_UUID]]))
+        await lock
+
+    async def test_only_data_bundle_results_carry_miso(self):
+        self.expander.result_carries_miso = True
+        lock = asyncio.create_task(self.expander.set_lock(2))
+        read = asyncio.create_task(self.expander.read(0x62, 3))
+        await self.written(2)
+        self.client.result(bytes([ID_MAP[LOCK_UUID], 0xAA]))
+        self.client.result(bytes([ID_MAP[DATA_BUNDLE_UUID], 1, 2, 3]))
+        await lock
+        self.assertEqual(await read, b'\x01\x02\x03')
+
+    async def test_other_tasks_wait_for_the_session(self):
+        self.client.auto_result = True
+        self.client.miso = bytearray(3)
+        entered = asyncio.Event()
+        leave = asyncio.Event()
+
+        async def session():
+            async with self.expander.session():
+                entered.set()
+                await leave.wait()
+
+        holder = asyncio.create_task(session())
+        await entered.wait()
+        other = asyncio.create_task(self.expander.read(0x62, 3))
+        await asyncio.sleep(0.01)
+        self.assertFalse(other.done())
+        self.assertFalse(any(uuid == DATA_BUNDLE_UUID for uuid, _ in self.client.writes))
+
+        leave.set()
+        await holder
+        await other
+
+    async def test_stream_sets_power_and_cs_once_per_frame(self):
+        self.client.auto_result = True
+        self.client.miso = bytearray(4)
+        self.expander.stream_chunk_size = 4
+        await self.expander.xfer_stream(bytearray(range(10)))
+
+        bundles = [data for uuid, data in self.client.writes if uuid == DATA_BUNDLE_UUID]
+        self.assertEqual(len(bundles), 3)
+        power_and_cs = 1 << 6 | 1 << 5
+        self.assertEqual(bundles[0][0] & power_and_cs, power_and_cs)
+        self.assertEqual([bundle[0] & power_and_cs for bundle in bundles[1:]], [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()